@@ -2,8 +2,12 @@
 Pull data from CA open data related to medical surge facilities 
 and hospital data
 """
+import io
 import pandas as pd
+from processing_utils import artifacts
 from processing_utils import default_parameters
+from processing_utils import fetch
+from processing_utils import parquet_dtypes
 
 """ 
 The catalog file seems to throw up an error 
@@ -31,6 +35,20 @@ SURGE_CAPACITY_URL = (
 
 S3_FILE_PATH = default_parameters.S3_FILE_PATH 
 
+# Name the fetch cache records our processed source versions under
+JOB_NAME = "ca_hospital"
+
+
+def source_urls():
+    """
+    Everything update_ca_surge_hospital_data downloads, to fetch concurrently.
+    """
+    return {
+        "hospital": HOSPITAL_DATA_URL,
+        "surge": SURGE_CAPACITY_URL,
+    }
+
+
 def clean_surge_data(df):
     keep = ["county", "date", "type_of_facility", "available_beds", "occupied_beds"] 
 
@@ -116,23 +134,31 @@ def grab_county_fips(df):
 
 
 def update_ca_surge_hospital_data(**kwargs):    
+    raw = fetch.fetch_all(source_urls())
+
+    if fetch.already_processed(JOB_NAME, raw):
+        print("CA hospital and surge sources unchanged, skipping")
+        return
+
     # Grab hospital capacity data
     #hospital_df = catalog.ca_open_data.hospital_capacity.read()
-    hospital_df = pd.read_csv(HOSPITAL_DATA_URL)
+    hospital_df = pd.read_csv(io.BytesIO(raw["hospital"].content))
     hospital_df = clean_hospital_data(hospital_df)
     hospital_df = grab_county_fips(hospital_df)
 
     # Grab surge capacity data
     #surge_df = catalog.ca_open_data.medical_surge_facilities.read()
-    surge_df = pd.read_csv(SURGE_CAPACITY_URL)
+    surge_df = pd.read_csv(io.BytesIO(raw["surge"].content))
     surge_df = clean_surge_data(surge_df)
     surge_df = grab_county_fips(surge_df)
     
     # Export to S3 separately
-    hospital_df.to_parquet(f"{S3_FILE_PATH}ca-hospital-capacity.parquet")
-    hospital_df.to_csv(f"{S3_FILE_PATH}ca-hospital-capacity.csv", index=False)
-    surge_df.to_parquet(f"{S3_FILE_PATH}ca-medical-surge-facilities.parquet")
-    surge_df.to_csv(f"{S3_FILE_PATH}ca-medical-surge-facilities.csv", index=False)
+    artifacts.write_parquet(parquet_dtypes.compact_dtypes(hospital_df, date_cols=["date"]),
+        f"{S3_FILE_PATH}ca-hospital-capacity.parquet")
+    artifacts.write_csv(hospital_df, f"{S3_FILE_PATH}ca-hospital-capacity.csv", index=False)
+    artifacts.write_parquet(parquet_dtypes.compact_dtypes(surge_df, date_cols=["date"]),
+        f"{S3_FILE_PATH}ca-medical-surge-facilities.parquet")
+    artifacts.write_csv(surge_df, f"{S3_FILE_PATH}ca-medical-surge-facilities.csv", index=False)
 
     """
     Create a county time-series df at county-date level.
@@ -174,5 +200,8 @@ def update_ca_surge_hospital_data(**kwargs):
         .reset_index(drop=True)
     )
 
-    m1.to_parquet(f"{S3_FILE_PATH}ca-hospital-and-surge-capacity.parquet")
-    m1.to_csv(f"{S3_FILE_PATH}ca-hospital-and-surge-capacity.csv", index=False)
\ No newline at end of file
+    artifacts.write_parquet(parquet_dtypes.compact_dtypes(m1, date_cols=["date"]),
+        f"{S3_FILE_PATH}ca-hospital-and-surge-capacity.parquet")
+    artifacts.write_csv(m1, f"{S3_FILE_PATH}ca-hospital-and-surge-capacity.csv", index=False)
+
+    fetch.mark_processed(JOB_NAME, raw)
\ No newline at end of file
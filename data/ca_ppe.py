@@ -4,8 +4,11 @@ Pull data from CA open data related to PPE
 #import intake
 #import intake_dcat
 #import os
+import io
 import pandas as pd
 
+from processing_utils import fetch
+
 # Civis container script clones the repo and we are in /app
 # Feed it the absolute path to our catalog.yml
 PPE_URL = (
@@ -18,6 +21,9 @@ PPE_URL = (
 bucket_name = "public-health-dashboard"
 S3_FILE_PATH = f"s3://{bucket_name}/jhu_covid19/"
 
+# Name the fetch cache records our processed source versions under
+JOB_NAME = "ca_ppe"
+
 def clean_data(df):
     df = (df.assign(
             quantity_filled = df.quantity_filled.astype("Int64"),
@@ -111,8 +117,16 @@ def categorize_ppe(row):
 
 def update_ca_ppe(**kwargs):    
     #df = catalog.ca_open_data.ppe.read()
-    df = pd.read_csv(PPE_URL)
+    raw = {"ppe": fetch.fetch(PPE_URL)}
+
+    if fetch.already_processed(JOB_NAME, raw):
+        print("CA PPE source unchanged, skipping")
+        return
+
+    df = pd.read_csv(io.BytesIO(raw["ppe"].content))
     df = clean_data(df)
     df.to_parquet(f"{S3_FILE_PATH}ca-ppe.parquet")
     df.to_csv(f"{S3_FILE_PATH}ca-ppe.csv", index=False)
 
+    fetch.mark_processed(JOB_NAME, raw)
+
@@ -2,14 +2,10 @@
 Schedule this script to update our datasets.
 Less frequent updates.
 """
-import jhu
-import jhu_county
+import etl_tasks
 
-import ca_hospital
+from processing_utils import task_graph
 
-jhu.load_global_covid_data()
-jhu_county.append_county_time_series()
+task_graph.run(etl_tasks.occasional_tasks())
 
-ca_hospital.update_ca_surge_hospital_data()
-
-print("Successful update of occasional data")
\ No newline at end of file
+print("Successful update of occasional data")
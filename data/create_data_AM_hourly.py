@@ -2,14 +2,10 @@
 Schedule this script to update our datasets.
 Hourly updates because these depend on Google sheets.
 """
-import la_neighborhood
+import etl_tasks
 
-import sync_covid_testing
-import sync_la_cases
+from processing_utils import task_graph
 
-la_neighborhood.update_neighborhood_data()
+task_graph.run(etl_tasks.hourly_tasks())
 
-sync_la_cases.update_la_cases_data()
-sync_covid_testing.update_covid_testing_city_county_data()
-
-print("Successful update of hourly data")
\ No newline at end of file
+print("Successful update of hourly data")
@@ -0,0 +1,99 @@
+"""
+The scheduled ETL jobs, as task graphs for processing_utils.task_graph.
+create_data.py and create_data_AM_hourly.py run these.
+"""
+import ca_hospital
+import jhu
+import jhu_county
+import la_neighborhood
+import sync_la_cases
+
+from processing_utils import default_parameters
+from processing_utils import us_county_dataset
+from processing_utils import utils
+from processing_utils.default_parameters import remap_missing_file
+
+from processing_utils.task_graph import Task
+
+S3_FILE_PATH = default_parameters.S3_FILE_PATH
+S3_FILE_PATH_SOURCE = default_parameters.S3_FILE_PATH_SOURCE
+
+
+def occasional_tasks():
+    return [
+        Task(
+            "jhu", "jhu:load_global_covid_data",
+            outputs=[
+                f"{S3_FILE_PATH}global-time-series.csv",
+                f"{S3_FILE_PATH}global-time-series.parquet",
+            ],
+            sources=list(jhu.source_urls().values()),
+        ),
+        Task(
+            "jhu_county", "jhu_county:append_county_time_series",
+            outputs=[
+                f"{S3_FILE_PATH}us-county-time-series.csv",
+                jhu_county.STORE_PATH,
+                us_county_dataset.DATASET_URL,
+                jhu_county.RAW_TOTALS_PATH,
+                f"{S3_FILE_PATH}us-county-time-series-short.csv",
+            ],
+            sources=list(jhu_county.source_urls().values()),
+        ),
+        Task(
+            "ca_hospital", "ca_hospital:update_ca_surge_hospital_data",
+            inputs=["/app/data/msa_county_pop_crosswalk.csv"],
+            outputs=[
+                f"{S3_FILE_PATH}ca-hospital-capacity.parquet",
+                f"{S3_FILE_PATH}ca-hospital-capacity.csv",
+                f"{S3_FILE_PATH}ca-medical-surge-facilities.parquet",
+                f"{S3_FILE_PATH}ca-medical-surge-facilities.csv",
+                f"{S3_FILE_PATH}ca-hospital-and-surge-capacity.parquet",
+                f"{S3_FILE_PATH}ca-hospital-and-surge-capacity.csv",
+            ],
+            sources=list(ca_hospital.source_urls().values()),
+        ),
+    ]
+
+
+def hourly_tasks():
+    return [
+        Task(
+            "la_neighborhood", "la_neighborhood:update_neighborhood_data",
+            inputs=[la_neighborhood.RSHINY_CASES],
+            outputs=[
+                f"{S3_FILE_PATH}la-county-neighborhood-time-series.parquet",
+                f"{S3_FILE_PATH}la-county-neighborhood-time-series.csv",
+            ],
+        ),
+        Task(
+            "sync_la_cases", "sync_la_cases:update_la_cases_data",
+            outputs=[
+                f"{S3_FILE_PATH}city-of-la-cases.csv",
+                f"{S3_FILE_PATH}city-of-la-cases.parquet",
+            ],
+            sources=[sync_la_cases.data_source_1],
+        ),
+        Task(
+            "sync_covid_testing", "sync_covid_testing:update_covid_testing_city_county_data",
+            inputs=[
+                remap_missing_file(S3_FILE_PATH, S3_FILE_PATH_SOURCE,
+                                   "county-persons-tested-rshiny.csv"),
+                remap_missing_file(S3_FILE_PATH, S3_FILE_PATH_SOURCE,
+                                   "county-tests-performed-rshiny.csv"),
+            ],
+            outputs=[
+                f"{S3_FILE_PATH}county-persons-tested-rshiny.parquet",
+                f"{S3_FILE_PATH}county-tests-performed-rshiny.parquet",
+                f"{S3_FILE_PATH}county-city-testing.csv",
+                f"{S3_FILE_PATH}county-city-testing.parquet",
+            ],
+        ),
+        # Tables the report notebooks read (processing_utils.feature_store).
+        # Always runs: it rebuilds whatever isn't fresh, and nothing when it all is.
+        Task(
+            "feature_store", "processing_utils.feature_store:build_all",
+            deps=["la_neighborhood"],
+            sources=[utils.COUNTY_VACCINE_URL],
+        ),
+    ]
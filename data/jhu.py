@@ -3,11 +3,16 @@ ETL for COVID-19 Data.
 Pulls from Johns-Hopkins CSSE data.
 """
 import geopandas as gpd
+import io
 import numpy as np
 import os
 import pandas as pd
+import pyarrow as pa
 
+from processing_utils import artifacts
 from processing_utils import default_parameters
+from processing_utils import fetch
+from processing_utils import wide_to_long
 
 from datetime import datetime, timedelta
 
@@ -55,66 +60,59 @@ JHU_GLOBAL_SOURCE_ID = (
 )
 
 
-def parse_columns(df):
+def source_urls(branch="master"):
     """
-    quick helper function to parse columns into values
-    uses for pd.melt
+    Everything load_global_covid_data downloads, to fetch concurrently.
     """
-    columns = list(df.columns)
+    return {
+        "cases": CASES_URL.format(branch),
+        "deaths": DEATHS_URL.format(branch),
+        "recovered": RECOVERED_URL.format(branch),
+        "current": JHU_GLOBAL_SOURCE_ID,
+    }
 
-    id_vars, dates = [], []
 
-    for c in columns:
-        if (c.endswith("20")) or (c.endswith("21")):
-            dates.append(c)
-        else:
-            id_vars.append(c)
-    return id_vars, dates
+# Name the fetch cache records our processed source versions under
+JOB_NAME = "jhu_global"
+
+# Id columns in the wide CSVs that aren't strings
+ID_TYPES = {"Lat": pa.float64(), "Long": pa.float64()}
 
 
 sort_cols = ["Country_Region", "Province_State", "date"]
 
 
-def load_jhu_global_time_series(branch="master"):
+def load_jhu_global_time_series(branch="master", raw=None):
     """
     Loads the JHU global timeseries data, transforms it so we are happy with it.
+    
+    raw: dict of {name: fetch.Source}, already downloaded. Defaults to downloading them.
     """
-    cases = pd.read_csv(CASES_URL.format(branch))
-    deaths = pd.read_csv(DEATHS_URL.format(branch))
-    recovered = pd.read_csv(RECOVERED_URL.format(branch))
-    # melt cases
-    id_vars, dates = parse_columns(cases)
-    cases_df = pd.melt(
-        cases,
-        id_vars=id_vars,
-        value_vars=dates,
-        value_name="number_of_cases",
-        var_name="date",
-    )
-
-    # melt deaths
-    id_vars, dates = parse_columns(deaths)
-    deaths_df = pd.melt(
-        deaths,
-        id_vars=id_vars,
-        value_vars=dates,
-        value_name="number_of_deaths",
-        var_name="date",
+    if raw is None:
+        urls = source_urls(branch)
+        raw = fetch.fetch_all({k: urls[k] for k in ["cases", "deaths", "recovered"]})
+
+    # Cases and deaths list the same rows in the same order, stream them together
+    m1 = wide_to_long.wide_to_long(
+        {
+            "number_of_cases": raw["cases"].open(),
+            "number_of_deaths": raw["deaths"].open(),
+        },
+        key_cols=["Province/State", "Country/Region"],
+        id_types=ID_TYPES,
+        value_type=pa.int64(),
     )
 
-    # melt recovered
-    id_vars, dates = parse_columns(recovered)
-    recovered_df = pd.melt(
-        recovered,
-        id_vars=id_vars,
-        value_vars=dates,
-        value_name="number_of_recovered",
-        var_name="date",
+    # Recovered has different rows, so it's merged on
+    recovered_df = wide_to_long.wide_to_long(
+        {"number_of_recovered": raw["recovered"].open()},
+        key_cols=["Province/State", "Country/Region"],
+        id_types=ID_TYPES,
+        value_type=pa.int64(),
     )
 
     # join
     merge_cols = ["Province/State", "Country/Region", "Lat", "Long", "date"]
-    m1 = pd.merge(cases_df, deaths_df, on=merge_cols, how="left")
     df = pd.merge(m1, recovered_df, on=merge_cols, how="left")
 
     df = (df.assign(
@@ -133,12 +131,15 @@ def load_jhu_global_time_series(branch="master"):
     return df.sort_values(sort_cols).reset_index(drop=True)
 
 
-def load_jhu_global_current(**kwargs):
+def load_jhu_global_current(raw=None, **kwargs):
     """
     Loads the JHU global current data, transforms it so we are happy with it.
     """
+    if raw is None:
+        raw = {"current": fetch.fetch(JHU_GLOBAL_SOURCE_ID)}
+
     # Load current data from ESRI
-    sdf = gpd.read_file(JHU_GLOBAL_SOURCE_ID)
+    sdf = gpd.read_file(io.BytesIO(raw["current"].content))
 
     sdf = sdf.assign(
         date = (pd.to_datetime(sdf.Last_Update, unit="ms")
@@ -194,10 +195,17 @@ def load_global_covid_data():
     """
     Load global COVID-19 data from JHU.
     """
-    historical_df = load_jhu_global_time_series()
+    # Download the CSVs and feature layer at the same time
+    raw = fetch.fetch_all(source_urls())
+
+    if fetch.already_processed(JOB_NAME, raw):
+        print("JHU global sources unchanged, skipping")
+        return
+
+    historical_df = load_jhu_global_time_series(raw=raw)
 
     # Bring in the current date's JHU data
-    today_df = load_jhu_global_current()
+    today_df = load_jhu_global_current(raw)
     coordinates = today_df[
         ["Province_State", "Country_Region", "Lat", "Long"]
     ].drop_duplicates()
@@ -228,5 +236,8 @@ def load_global_covid_data():
     )
 
     # Output to CSV
-    df.to_csv(f"{S3_FILE_PATH}global-time-series.csv", index=False)
-    df.to_parquet(f"{S3_FILE_PATH}global-time-series.parquet")
+    artifacts.write_csv(df, f"{S3_FILE_PATH}global-time-series.csv", index=False)
+    # Published to GitHub as is, so it keeps its schema (no compact_dtypes)
+    artifacts.write_parquet(df, f"{S3_FILE_PATH}global-time-series.parquet")
+
+    fetch.mark_processed(JOB_NAME, raw)
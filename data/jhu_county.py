@@ -3,16 +3,32 @@ Grab the JHU US county CSV from GitHub
 and add JHU current feature layer to this.
 """
 import geopandas as gpd
+import io
 import numpy as np
 import os
 import pandas as pd
+import pyarrow as pa
 
+from processing_utils import artifacts
 from processing_utils import default_parameters
+from processing_utils import fetch
+from processing_utils import parquet_dtypes
+from processing_utils import us_county_dataset
+from processing_utils import wide_to_long
 
 from datetime import datetime, timedelta
 
 S3_FILE_PATH = default_parameters.S3_FILE_PATH
 
+STORE_PATH = f"{S3_FILE_PATH}us-county-time-series.parquet"
+
+# National totals for each date column of the wide CSVs, as of our last run.
+# Used to tell whether JHU revised dates we've already ingested.
+RAW_TOTALS_PATH = f"{S3_FILE_PATH}jhu-us-time-series-totals.parquet"
+
+# Name the fetch cache records our processed source versions under
+JOB_NAME = "jhu_county"
+
 # URL to JHU confirmed cases US county time series.
 CASES_URL = (
     "https://github.com/CSSEGISandData/COVID-19/raw/{}/"
@@ -33,6 +49,16 @@ LOOKUP_TABLE_URL = (
     "UID_ISO_FIPS_LookUp_Table.csv"
 )
 
+# Id columns in the wide CSVs that aren't strings
+ID_TYPES = {
+    "UID": pa.int64(),
+    "code3": pa.int64(),
+    "FIPS": pa.float64(),
+    "Lat": pa.float64(),
+    "Long_": pa.float64(),
+    "Population": pa.int64(),
+}
+
 # General function
 #JHU_FEATURE_ID = "628578697fb24d8ea4c32fa0c5ae1843"
 JHU_FEATURE_ID = (
@@ -51,23 +77,28 @@ JHU_FEATURE_ID = (
     "returnExceededLimitFeatures=true&quantizationParameters=&sqlFormat=none&f=pgeojson&token="
 )
 
-def parse_columns(df):
+
+def source_urls(branch="master"):
     """
-    quick helper function to parse columns into values
-    uses for pd.melt
+    Everything append_county_time_series downloads, to fetch concurrently.
     """
-    columns = list(df.columns)
+    return {
+        "cases": CASES_URL.format(branch),
+        "deaths": DEATHS_URL.format(branch),
+        "lookup": LOOKUP_TABLE_URL.format(branch),
+        "current": JHU_FEATURE_ID,
+    }
 
-    id_vars, dates = [], []
 
-    for c in columns:
-        if (c.endswith("20") or (c.endswith("21")) or 
-            (c.endswith("22") or (c.endswith("23")))
-           ):
-            dates.append(c)
-        else:
-            id_vars.append(c)
-    return id_vars, dates
+def column_dates(dates):
+    """
+    Date column names (1/22/20) to the same UTC timestamps as our date column
+    """
+    return (wide_to_long.column_dates(dates)
+            .tz_localize("US/Pacific")
+            .normalize()
+            .tz_convert("UTC")
+           )
 
 
 def fix_fips(df):
@@ -92,47 +123,24 @@ def fix_fips(df):
 sort_cols = ["state", "county", "fips", "date"]
 
 
-def load_jhu_us_time_series(branch="master"):
+def load_jhu_us_time_series(branch="master", since=None, totals=None, raw=None, until=None):
     """
     Loads the JHU US timeseries data, transforms it so we are happy with it.
+    
+    since: timestamp. If given, only the date columns on or after it are converted.
+    until: timestamp. If given, only the date columns before it are converted.
+    totals: dict. If given, filled with the national totals of every date column
+            in the cases and deaths CSVs (see wide_to_long).
+    raw: dict of {name: fetch.Source}, already downloaded. Defaults to downloading them.
     """
-    cases = pd.read_csv(CASES_URL.format(branch))
-    deaths = pd.read_csv(DEATHS_URL.format(branch))
-    lookup_table = pd.read_csv(LOOKUP_TABLE_URL.format(branch))
-
-    keep_lookup_cols = ["UID", "Population"]
-    lookup_table = lookup_table[keep_lookup_cols]
-
-    # melt cases
-    id_vars, dates = parse_columns(cases)
-    cases_df = pd.melt(
-        cases, id_vars=id_vars, value_vars=dates, value_name="cases", var_name="date",
-    )
-
-    # melt deaths
-    id_vars, dates = parse_columns(deaths)
-    deaths_df = pd.melt(
-        deaths, id_vars=id_vars, value_vars=dates, value_name="deaths", var_name="date",
-    )
-
-    # join
-    merge_cols = [
-        "iso2",
-        "iso3",
-        "code3",
-        "FIPS",
-        "Admin2",
-        "Province_State",
-        "Country_Region",
-        "Lat",
-        "Long_",
-        "Combined_Key"
-    ]
+    def keep_dates(dates):
+        timestamps = column_dates(dates)
+        return [d for d, ts in zip(dates, timestamps) 
+                if (since is None or ts >= since) and (until is None or ts < until)]
     
-    m1 = pd.merge(cases_df, deaths_df.drop(columns = merge_cols), 
-            on=["UID", "date"], how="left")
-
-    df = pd.merge(m1.drop(columns="Population"), lookup_table, on="UID", how="left")
+    if raw is None:
+        urls = source_urls(branch)
+        raw = fetch.fetch_all({k: urls[k] for k in ["cases", "deaths", "lookup"]})
 
     keep_cols = [
         "Province_State",
@@ -146,6 +154,25 @@ def load_jhu_us_time_series(branch="master"):
         "Population",
     ]
 
+    # Stream cases and deaths together, their rows line up by UID.
+    # Only the columns we keep (and UID, to merge on) are held, batch by batch.
+    df = wide_to_long.wide_to_long(
+        {"cases": raw["cases"].open(), "deaths": raw["deaths"].open()},
+        key_cols=["UID"], 
+        columns=["UID"] + [c for c in keep_cols if c != "Population"],
+        id_types=ID_TYPES, 
+        value_type=pa.int64(),
+        keep_dates=keep_dates, 
+        totals=totals,
+    )
+    
+    lookup_table = pd.read_csv(io.BytesIO(raw["lookup"].content))
+
+    keep_lookup_cols = ["UID", "Population"]
+    lookup_table = lookup_table[keep_lookup_cols]
+
+    df = pd.merge(df, lookup_table, on="UID", how="left")
+
     df = (
         df[keep_cols]
         .assign(
@@ -171,12 +198,15 @@ def load_jhu_us_time_series(branch="master"):
     return df.sort_values(sort_cols).reset_index(drop=True)
 
 
-def load_jhu_us_current(**kwargs):
+def load_jhu_us_current(raw=None, **kwargs):
     """
     Loads the JHU US current data, transforms it so we are happy with it.
     """
+    if raw is None:
+        raw = {"current": fetch.fetch(JHU_FEATURE_ID)}
+    
     # Import data
-    jhu = gpd.read_file(JHU_FEATURE_ID)
+    jhu = gpd.read_file(io.BytesIO(raw["current"].content))
 
     # Create localized then normalized date column
     jhu["date"] = pd.Timestamp.now(tz="US/Pacific").normalize().tz_convert("UTC")
@@ -320,20 +350,12 @@ def calculate_change(df):
 
 
 # (6) Fix column types before exporting
-def fix_column_dtypes(df):
-    # Counties with zero cases are included in Jan/Feb/Mar.
-    # Makes CSV huge. Drop these.
-    df["obs"] = (
-        df.sort_values(sort_cols).groupby(["state", "county", "fips"]).cumcount() + 1
-    )
-    df["nonzero_case"] = df.apply(
-        lambda row: row.obs if row.cases > 0 else np.nan, axis=1
-    )
-    df["first_case"] = df.groupby(["state", "county", "fips"])[
-        "nonzero_case"
-    ].transform("min")
-
-    df = df[df.obs >= df.first_case].drop(columns=["obs", "nonzero_case", "first_case"])
+def fix_column_dtypes(df, started=None):
+    """
+    started: df of state, county, fips that are already past their first case
+            (see drop_leading_zeros)
+    """
+    df = drop_leading_zeros(df, started)
 
     # Calculate incident rate, which is cases per 100k
     incident_rate_pop = 100_000
@@ -380,18 +402,120 @@ def fix_column_dtypes(df):
     return df
 
 
-def append_county_time_series(**kwargs):
+def drop_leading_zeros(df, started=None):
     """
-    Load JHU's CSV and append today's US county data.
+    Counties with zero cases are included in Jan/Feb/Mar.
+    Makes CSV huge. Drop each county's rows before its first case.
+    
+    started: df of state, county, fips. These counties had a case 
+            before the rows in df, so none of their rows are dropped.
+            Stored rows start at each county's first case, so when df is 
+            only the new dates, the stored counties are what's started.
     """
-    # (1) Load historical time-series
-    historical_df = load_jhu_us_time_series()
+    group_cols = ["state", "county", "fips"]
+    
+    df["obs"] = (
+        df.sort_values(sort_cols).groupby(group_cols).cumcount() + 1
+    )
+    df["nonzero_case"] = df.apply(
+        lambda row: row.obs if row.cases > 0 else np.nan, axis=1
+    )
+    df["first_case"] = df.groupby(group_cols)[
+        "nonzero_case"
+    ].transform("min")
 
-    # (2) Bring in current JHU feature layer and clean
-    today_df = load_jhu_us_current()
+    keep = df.obs >= df.first_case
+    
+    if started is not None:
+        keys = pd.MultiIndex.from_frame(df[group_cols].astype(str))
+        started_keys = pd.MultiIndex.from_frame(started[group_cols].astype(str))
+        keep = keep | keys.isin(started_keys)
+
+    return df[keep].drop(columns=["obs", "nonzero_case", "first_case"])
+
+
+# (5b) Calculate change for new dates only
+def calculate_change_since(df, previous_day):
+    """
+    calculate_change for just the new dates, diffing against the last stored day.
+    
+    State diffs are taken between consecutive dates of the state totals,
+    which is what calculate_change gives every row after a county's first.
+    """
+    df = calculate_change(pd.concat([previous_day, df], sort=False))
+    
+    state_totals = (df[["state", "date", "state_cases", "state_deaths"]]
+                    .drop_duplicates(subset=["state", "date"])
+                    .sort_values(["state", "date"])
+                   )
+    
+    state_totals = state_totals.assign(
+        new_state_cases=state_totals.groupby("state")["state_cases"].diff(periods=1),
+        new_state_deaths=state_totals.groupby("state")["state_deaths"].diff(periods=1),
+    )
+    
+    state_totals = state_totals.assign(
+        new_state_cases=state_totals.new_state_cases.fillna(state_totals.state_cases),
+        new_state_deaths=state_totals.new_state_deaths.fillna(state_totals.state_deaths),
+    )
+    
+    df = pd.merge(
+        df.drop(columns=["new_state_cases", "new_state_deaths"]),
+        state_totals[["state", "date", "new_state_cases", "new_state_deaths"]],
+        on=["state", "date"],
+        how="left",
+        validate="m:1",
+    )
+    
+    return df[df.date > previous_day.date.max()]
+
+
+# Detect revisions to history
+def raw_totals(totals):
+    """
+    National totals for each date column in the wide CSVs, 
+    collected while streaming them.
+    Changes if JHU revises any county on that date.
+    """
+    df = pd.DataFrame({
+        "cases": totals["cases"],
+        "deaths": totals["deaths"],
+    })
+    
+    return df.rename_axis("date").reset_index()
+
+
+def history_revised(totals, previous_totals, since):
+    """
+    True if any date before `since` changed (or disappeared) since our last run.
+    """
+    df = pd.merge(previous_totals, totals, on="date", how="left", suffixes=("_old", ""))
+    df = df[column_dates(df.date) < since]
+    
+    return not ((df.cases == df.cases_old).all() and 
+                (df.deaths == df.deaths_old).all())
+
+
+def build_county_time_series(today_df, branch="master", totals=None, raw=None, parsed=None):
+    """
+    Full rebuild from every date column.
+    
+    parsed: (since, df). The date columns on or after since, already loaded
+            by update_county_time_series. Only the ones before since are loaded here.
+    """
+    # (1) Load historical time-series
+    if parsed is None:
+        historical_df = load_jhu_us_time_series(branch, totals=totals, raw=raw)
+    else:
+        since, new_df = parsed
+        historical_df = (pd.concat([load_jhu_us_time_series(branch, raw=raw, until=since), 
+                                    new_df], ignore_index=True)
+                         .sort_values(sort_cols)
+                         .reset_index(drop=True)
+                        )
 
     # (3) Fill in missing stuff after appending
-    us_county = historical_df.append(today_df, sort=False)
+    us_county = pd.concat([historical_df, today_df], sort=False)
     us_county = fill_missing_stuff(us_county)
 
     # (4) Calculate US state totals
@@ -402,16 +526,132 @@ def append_county_time_series(**kwargs):
 
     # (6) Fix column types before exporting
     final = fix_column_dtypes(us_county)
+    
+    return final
+
+
+def read_store():
+    """
+    Stored parquet, in the dtypes we process with:
+    strings, Int64 counts, and dates as UTC timestamps at midnight Pacific.
+    A store written compacted (calendar dates, categoricals) is expanded back.
+    """
+    df = parquet_dtypes.expand_dtypes(pd.read_parquet(STORE_PATH))
+    
+    if not isinstance(df.date.dtype, pd.DatetimeTZDtype):
+        df = df.assign(
+            date=pd.to_datetime(df.date)
+            .dt.tz_localize("US/Pacific")
+            .dt.tz_convert("UTC"),
+        )
+    
+    return df
+
+
+def update_county_time_series(today_df, branch="master", raw=None):
+    """
+    Only process the date columns we haven't ingested yet, and append them.
+    
+    Our last stored date came from the current feature layer, 
+    so it's redone from the CSV, along with anything newer.
+    
+    Returns the final df, the raw totals, and (since, df) of the date columns it loaded.
+    final is None if there's no store to build on, the CSV doesn't reach 
+    our last stored date, or JHU revised history. Caller does a full rebuild,
+    reusing the loaded date columns.
+    """
+    try:
+        stored = read_store()
+        previous_totals = pd.read_parquet(RAW_TOTALS_PATH)
+    except (OSError, ValueError):
+        return None, None, None
+    
+    last_date = stored.date.max()
+    previous_date = stored.date[stored.date < last_date].max()
+    
+    if pd.isna(previous_date):
+        return None, None, None
+    
+    # (1) - (3) only for the new date columns
+    streamed = {}
+    new_df = load_jhu_us_time_series(branch, since=last_date, totals=streamed, raw=raw)
+    totals = raw_totals(streamed)
+    
+    if (column_dates(totals.date).max() < last_date or
+        history_revised(totals, previous_totals, last_date)):
+        return None, totals, (last_date, new_df)
+    
+    tail = pd.concat([new_df, today_df], sort=False)
+    tail = fill_missing_stuff(tail)
+    
+    # (4) State totals for the new dates only
+    tail = us_state_totals(tail)
+
+    # (5) Diff against the last day we keep
+    previous_day = stored[stored.date == previous_date]
+    tail = calculate_change_since(tail, previous_day)
+    
+    # (6) Counties already stored are past their first case,
+    # only new counties have leading zero rows to drop, same as a full rebuild
+    kept = stored[stored.date < last_date]
+    started = kept[["state", "county", "fips"]].drop_duplicates()
+    tail = fix_column_dtypes(tail, started=started)
+    
+    final = (pd.concat([kept, tail], sort=False)
+             .sort_values(["state", "county", "fips", "date", "cases"])
+            )
+    
+    return final, totals, (last_date, new_df)
+
+
+def append_county_time_series(incremental=True, branch="master", **kwargs):
+    """
+    Load JHU's CSV and append today's US county data.
+    
+    incremental: bool. If True, only process dates after what's already stored,
+                falling back to a full rebuild when that's not possible.
+    """
+    # Download the CSVs and feature layer at the same time
+    raw = fetch.fetch_all(source_urls(branch))
+
+    # Today's row is stamped with today's date, so a new day is new output
+    today = str(default_parameters.today_date)
+    if fetch.already_processed(JOB_NAME, raw, depends_on=today):
+        print("JHU US sources unchanged, skipping")
+        return
+
+    # (2) Bring in current JHU feature layer and clean
+    today_df = load_jhu_us_current(raw)
+    
+    final = None
+    parsed = None
+    if incremental:
+        final, totals, parsed = update_county_time_series(today_df, branch, raw)
+    
+    if final is None and parsed is not None:
+        # The CSVs were already read, totals and the new dates are reused
+        final = build_county_time_series(today_df, branch, raw=raw, parsed=parsed)
+    elif final is None:
+        streamed = {}
+        final = build_county_time_series(today_df, branch, totals=streamed, raw=raw)
+        totals = raw_totals(streamed)
 
     # (7) Write to CSV and overwrite the old feature layer.
-    final.to_csv(f"{S3_FILE_PATH}us-county-time-series.csv", index=False)
-    final.to_parquet(f"{S3_FILE_PATH}us-county-time-series.parquet")
+    artifacts.write_csv(final, f"{S3_FILE_PATH}us-county-time-series.csv", index=False)
+    # The store is published to GitHub, so it keeps its schema.
+    # Only the dataset we read back internally is compacted.
+    artifacts.write_parquet(final, STORE_PATH)
+    compact = parquet_dtypes.compact_dtypes(final, date_cols=["date"])
+    artifacts.write(compact, us_county_dataset.DATASET_URL, 
+                    us_county_dataset.write_us_county_dataset)
+    artifacts.write_parquet(totals, RAW_TOTALS_PATH)
     
     # (8) Create a smaller CSV (with 2021 data that is constantly updated)
     final_short = final.assign(
         date2 = pd.to_datetime(final.date),
     )
 
-    (final_short[final_short.date2 >= "2021-1-1"]
-                .to_csv(f"{S3_FILE_PATH}us-county-time-series-short.csv", index=False)
-    )
\ No newline at end of file
+    artifacts.write_csv(final_short[final_short.date2 >= "2021-1-1"],
+        f"{S3_FILE_PATH}us-county-time-series-short.csv", index=False)
+    
+    fetch.mark_processed(JOB_NAME, raw, depends_on=today)
\ No newline at end of file
@@ -2,7 +2,9 @@ import geopandas as gpd
 import pandas as pd
 import pytz
 
+from processing_utils import artifacts
 from processing_utils import default_parameters
+from processing_utils import parquet_dtypes
 from processing_utils.default_parameters import remap_missing_file
 
 from datetime import datetime
@@ -165,6 +167,10 @@ def grab_today_from_rshiny():
 
 def update_neighborhood_data():
     historical_df = pd.read_parquet(remap_missing_file(S3_FILE_PATH,S3_FILE_PATH_SOURCE,"la-county-neighborhood-time-series.parquet"))
+    
+    # Back to the dtypes we append with: strings, Int64, and date as a string
+    historical_df = parquet_dtypes.expand_dtypes(historical_df)
+    historical_df = historical_df.assign(date = historical_df.date.astype(str))
 
 
     today_df = grab_today_from_rshiny()    
@@ -229,5 +235,6 @@ def update_neighborhood_data():
              .reset_index(drop=True)
             )
     
-    final.to_parquet(f"{S3_FILE_PATH}la-county-neighborhood-time-series.parquet")
-    final.to_csv(f"{S3_FILE_PATH}la-county-neighborhood-time-series.csv", index=False)
+    artifacts.write_parquet(parquet_dtypes.compact_dtypes(final, date_cols=["date"]),
+        f"{S3_FILE_PATH}la-county-neighborhood-time-series.parquet")
+    artifacts.write_csv(final, f"{S3_FILE_PATH}la-county-neighborhood-time-series.csv", index=False)
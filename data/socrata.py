@@ -1,4 +1,5 @@
 import dotenv
+import io
 import os
 import pandas as pd
 
@@ -6,9 +7,11 @@ from arcgis.gis import GIS
 from arcgis.features import FeatureLayerCollection, FeatureLayer
 
 from processing_utils import default_parameters
+from processing_utils import fetch
 from processing_utils import neighborhood_utils
 from processing_utils import utils
 from processing_utils import socrata_utils
+from processing_utils import us_county_dataset
 
 S3_FILE_PATH = default_parameters.S3_FILE_PATH
 S3_FILE_PATH_SOURCE = default_parameters.S3_FILE_PATH_SOURCE
@@ -35,9 +38,8 @@ DATAFRAME_DICT = {
 }
 
 def us_county(csv_file, county_list=["Los Angeles"]):
-    parquet_file = csv_file.replace('.csv', '.parquet')
-    
-    df = pd.read_parquet(f"{S3_FILE_PATH}{parquet_file}")
+    # Only read the counties we need from the partitioned dataset
+    df = us_county_dataset.read_us_county(counties=county_list)
  
     df = (df[df.county.isin(county_list)]
           .reset_index(drop=True)
@@ -82,7 +84,7 @@ def la_county_neighborhood(csv_file):
 
 
 def ca_vaccinations(csv_file):
-    df = pd.read_csv(utils.COUNTY_VACCINE_URL)
+    df = pd.read_csv(io.BytesIO(fetch.fetch(utils.COUNTY_VACCINE_URL).content))
 
     population = pd.read_parquet(f"{S3_FILE_PATH_SOURCE}ca_county_pop_crosswalk.parquet")    
 
@@ -97,7 +99,7 @@ def ca_vaccinations(csv_file):
     return df
 
 def ca_vaccinations_demographics(csv_file):
-    df = pd.read_csv(utils.COUNTY_DEMOGRAPHICS_URL)
+    df = pd.read_csv(io.BytesIO(fetch.fetch(utils.COUNTY_DEMOGRAPHICS_URL).content))
     
     df = df.assign(
         date = pd.to_datetime(df.administered_date),
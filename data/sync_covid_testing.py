@@ -4,6 +4,7 @@ Pull data from MOPS COVID Dashboard and upload to S3
 import datetime
 import pandas as pd
 
+from processing_utils import artifacts
 from processing_utils import default_parameters
 from processing_utils.default_parameters import remap_missing_file
 
@@ -36,7 +37,7 @@ def update_persons_tested_rshiny():
         [keep]  
     )
 
-    df.to_parquet(f"{S3_FILE_PATH}county-persons-tested-rshiny.parquet")
+    artifacts.write_parquet(df, f"{S3_FILE_PATH}county-persons-tested-rshiny.parquet")
     
     return df
 
@@ -54,7 +55,7 @@ def update_tests_performed_rshiny():
         [keep]  
     )
 
-    df.to_parquet(f"{S3_FILE_PATH}county-tests-performed-rshiny.parquet")
+    artifacts.write_parquet(df, f"{S3_FILE_PATH}county-tests-performed-rshiny.parquet")
     
     return df
 
@@ -92,6 +93,6 @@ def update_covid_testing_city_county_data(**kwargs):
     df[integrify_me] = df[integrify_me].astype("Int64")
     
     # Export to S3
-    df.to_csv(f"{S3_FILE_PATH}county-city-testing.csv", index=False)
-    df.to_parquet(f"{S3_FILE_PATH}county-city-testing.parquet")
+    artifacts.write_csv(df, f"{S3_FILE_PATH}county-city-testing.csv", index=False)
+    artifacts.write_parquet(df, f"{S3_FILE_PATH}county-city-testing.parquet")
 
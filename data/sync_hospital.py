@@ -4,6 +4,7 @@ Pull data from Bed Availability Google Sheet and upload to S3
 import datetime
 import pandas as pd
 
+from processing_utils import artifacts
 from processing_utils import default_parameters
 
 S3_FILE_PATH = default_parameters.S3_FILE_PATH
@@ -28,8 +29,8 @@ def get_data(workbook):
             }
         )[keep]
     )   
-    df.to_csv(f"{S3_FILE_PATH}hospital-availability.csv", index=False)
-    df.to_parquet(f"{S3_FILE_PATH}hospital-availability.parquet")
+    artifacts.write_csv(df, f"{S3_FILE_PATH}hospital-availability.csv", index=False)
+    artifacts.write_parquet(df, f"{S3_FILE_PATH}hospital-availability.parquet")
 
 
 def update_bed_availability_data(**kwargs):
@@ -9,6 +9,7 @@ from datetime import timedelta
 from datetime import date
 
 
+from processing_utils import artifacts
 from processing_utils import default_parameters
 
 today_date = date.today()
@@ -114,8 +115,8 @@ def get_data():
             .reset_index(drop=True)
             )
 
-    df.to_csv(f"{S3_FILE_PATH}city-of-la-cases.csv", index=False)
-    df.to_parquet(f"{S3_FILE_PATH}city-of-la-cases.parquet")
+    artifacts.write_csv(df, f"{S3_FILE_PATH}city-of-la-cases.csv", index=False)
+    artifacts.write_parquet(df, f"{S3_FILE_PATH}city-of-la-cases.parquet")
 
 
 def update_la_cases_data(**kwargs):   
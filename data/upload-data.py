@@ -30,16 +30,17 @@ datasets = [
 ]
 
 
+# All the datasets go up in 1 commit
 for file_name in datasets:
     print(f"Uploading {S3_FILE_PATH}{file_name} to {BRANCH}/data/{file_name}")
-    gh.upload_file(
-        TOKEN,
-        REPO,
-        BRANCH,
-        f"{S3_FILE_PATH}{file_name}",
-        f"data/{file_name}",
-        f"Update {file_name}",
-        DEFAULT_COMMITTER,
-    )
+
+gh.upload_files(
+    TOKEN,
+    REPO,
+    BRANCH,
+    {f"{S3_FILE_PATH}{file_name}": f"data/{file_name}" for file_name in datasets},
+    f"Update {', '.join(datasets)}",
+    DEFAULT_COMMITTER,
+)
 
 print("Successful upload of datasets to GitHub")
@@ -1,16 +1,24 @@
 from . import default_parameters, useful_dict
+from . import dataset_cache, fetch, artifacts, parquet_dtypes, population_crosswalk
+from . import us_county_dataset, schemas, wide_to_long, task_graph, feature_store
+from . import array_utils, outliers, growth_metrics
 from . import utils, us_county_utils
-from . import make_charts, make_maps, neighborhood_charts
+from . import chart_render, chart_templates, make_charts, make_maps, neighborhood_charts
 from . import meet_indicators, ca_reopening_tiers
 from . import neighborhood_utils
 from . import socrata_utils
-from . import github_utils
+from . import github_utils, notebook_reports
 
 __version__ = "0.1.0"
 
-__all__ = ["default_parameters", "useful_dict", 
+__all__ = ["default_parameters", "useful_dict", "dataset_cache", "fetch",
+           "artifacts",
+           "parquet_dtypes", "population_crosswalk", "us_county_dataset", "schemas",
+           "wide_to_long", "task_graph", "feature_store",
+           "array_utils", "outliers",
+           "growth_metrics",
            "utils", "us_county_utils",
-           "make_charts", "make_maps", "neighborhood_charts",
+           "chart_render", "chart_templates", "make_charts", "make_maps", "neighborhood_charts",
            "meet_indicators", "ca_reopening_tiers", "neighborhood_utils", 
-           "socrata_utils","github_utils"]
+           "socrata_utils","github_utils", "notebook_reports"]
 
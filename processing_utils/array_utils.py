@@ -0,0 +1,91 @@
+"""
+Grouped array helpers.
+
+Replace groupby().apply(lambda x: x.shift()) and row-wise applies
+with one sort + NumPy array operations over the whole table.
+Used by the outlier and growth metric calculations.
+"""
+import numpy as np
+import pandas as pd
+
+
+def sort_and_group(df, sort_cols, group_cols):
+    """
+    Sort once and label each row with its group.
+    sort_cols must start with group_cols, so that every group
+    ends up in one contiguous block.
+
+    Returns:
+    order: numpy array, positions into df in sorted order
+    group_ids: numpy array, group label for each sorted row
+                (-1 if any of the group_cols is missing)
+    """
+    sorted_df = (df[sort_cols]
+                 .reset_index(drop=True)
+                 .sort_values(sort_cols, kind="mergesort")
+                )
+
+    order = sorted_df.index.to_numpy()
+    group_ids = sorted_df.groupby(group_cols, sort=False, observed=True).ngroup().to_numpy()
+
+    return order, group_ids
+
+
+def to_float_array(series):
+    """
+    Nullable Int64 / object columns to float, with pd.NA as np.nan
+    """
+    return pd.to_numeric(series, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+
+
+def grouped_shift(values, group_ids, periods):
+    """
+    Equivalent of df.groupby(group)[col].shift(periods),
+    for values already sorted so each group is contiguous.
+    Positive periods look back (previous day), negative look ahead (next day).
+    """
+    values = np.asarray(values, dtype="float64")
+    n = len(values)
+    shifted = np.full(n, np.nan)
+
+    if periods == 0 or abs(periods) >= n:
+        return values.copy() if periods == 0 else shifted
+
+    same_group = np.zeros(n, dtype=bool)
+
+    if periods > 0:
+        shifted[periods:] = values[:-periods]
+        same_group[periods:] = group_ids[periods:] == group_ids[:-periods]
+    else:
+        shifted[:periods] = values[-periods:]
+        same_group[:periods] = group_ids[:periods] == group_ids[-periods:]
+
+    shifted[~same_group | (group_ids == -1)] = np.nan
+
+    return shifted
+
+
+def grouped_cumcount(group_ids):
+    """
+    Equivalent of df.groupby(group).cumcount(),
+    for rows already sorted so each group is contiguous.
+    """
+    n = len(group_ids)
+    if n == 0:
+        return np.zeros(0, dtype="int64")
+
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = group_ids[1:] != group_ids[:-1]
+
+    start_positions = np.maximum.accumulate(np.where(starts, np.arange(n), 0))
+
+    return np.arange(n) - start_positions
+
+
+def unsort(sorted_values, order):
+    """
+    Put values computed in sorted order back in the original row order.
+    """
+    values = np.empty_like(sorted_values)
+    values[order] = sorted_values
+    return values
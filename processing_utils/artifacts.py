@@ -0,0 +1,146 @@
+"""
+Write ETL outputs only when their content changed.
+
+Most runs produce the same rows as the last one, but every output
+used to be rewritten anyway, which means S3 PUTs for large objects,
+and new ETags that invalidate every downstream cache (dataset_cache, notebooks).
+
+Before writing, hash the frame (values, index, columns, dtypes) and how it's
+written (writer, kwargs), and compare with the manifest kept next to the
+output (`_manifests/{name}.json`). The manifest also records the object's
+version (ETag / mtime) after our write, so an output that was deleted or
+overwritten by someone else is written again.
+
+Written and skipped outputs are recorded for the run; report() lists them.
+"""
+import hashlib
+import json
+import threading
+
+import fsspec
+import pandas as pd
+
+from processing_utils import dataset_cache
+
+MANIFEST_DIR = "_manifests"
+
+_lock = threading.Lock()
+_report = {"written": [], "skipped": []}
+
+
+def frame_hash(df):
+    """
+    Stable hash of a frame's values, index, column names and dtypes.
+    """
+    h = hashlib.sha256()
+    h.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+
+    return h.hexdigest()
+
+
+def content_hash(df, writer, kwargs):
+    h = hashlib.sha256(frame_hash(df).encode())
+    h.update(f"{writer.__module__}.{writer.__qualname__}".encode())
+    h.update(repr(sorted(kwargs.items())).encode())
+
+    return h.hexdigest()
+
+
+#---------------------------------------------------------------#
+# Manifest
+#---------------------------------------------------------------#
+def manifest_path(path):
+    head, name = path.rstrip("/").rsplit("/", 1)
+    return f"{head}/{MANIFEST_DIR}/{name}.json"
+
+
+def object_version(path):
+    """
+    Version of the object at path (JSON-friendly), or None if it's not there.
+    """
+    try:
+        version = dataset_cache.object_version(path)
+    except FileNotFoundError:
+        return None
+
+    return json.loads(json.dumps(version))
+
+
+def read_manifest(path):
+    try:
+        with fsspec.open(manifest_path(path), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(path, manifest):
+    fs, fs_path = fsspec.core.url_to_fs(manifest_path(path))
+    fs.makedirs(fs_path.rsplit("/", 1)[0], exist_ok=True)
+
+    with fs.open(fs_path, "w") as f:
+        json.dump(manifest, f)
+
+
+#---------------------------------------------------------------#
+# Write
+#---------------------------------------------------------------#
+def write(df, path, writer, **kwargs):
+    """
+    writer(df, path, **kwargs), unless path already holds this exact content.
+
+    writer: function that writes df to path,
+            like pd.DataFrame.to_parquet or us_county_dataset.write_us_county_dataset.
+    Returns True if it was written, False if it was skipped.
+    """
+    new_hash = content_hash(df, writer, kwargs)
+    manifest = read_manifest(path)
+
+    if (manifest is not None and manifest["hash"] == new_hash and
+        manifest["version"] == object_version(path)):
+        _record("skipped", path)
+        return False
+
+    writer(df, path, **kwargs)
+    write_manifest(path, {"hash": new_hash, "version": object_version(path)})
+    _record("written", path)
+
+    return True
+
+
+def write_csv(df, path, **kwargs):
+    return write(df, path, pd.DataFrame.to_csv, **kwargs)
+
+
+def write_parquet(df, path, **kwargs):
+    return write(df, path, pd.DataFrame.to_parquet, **kwargs)
+
+
+#---------------------------------------------------------------#
+# Report
+#---------------------------------------------------------------#
+def _record(outcome, path):
+    with _lock:
+        _report[outcome].append(path)
+
+
+def report():
+    """
+    dict of {"written": [paths], "skipped": [paths]} since the last reset_report().
+    """
+    with _lock:
+        return {outcome: list(paths) for outcome, paths in _report.items()}
+
+
+def reset_report():
+    with _lock:
+        for paths in _report.values():
+            paths.clear()
+
+
+def print_report():
+    outputs = report()
+    print(f"{len(outputs['written'])} outputs written, {len(outputs['skipped'])} unchanged")
+    for path in outputs["skipped"]:
+        print(f"  unchanged: {path}")
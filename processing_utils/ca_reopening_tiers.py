@@ -8,6 +8,7 @@ https://www.cdph.ca.gov/Programs/CID/DCDC/Pages/COVID-19/COVID19CountyMonitoring
 import numpy as np
 import pandas as pd
 
+from processing_utils import dataset_cache
 from processing_utils import default_parameters
 from processing_utils import utils
 
@@ -33,6 +34,19 @@ POP_RATE = 100_000
 # LA County population (using ca_county_pop_crosswalk)
 LA_POP = 10_257_557
 
+CA_POP_URL = f"{S3_FILE_PATH_SOURCE}ca_county_pop_crosswalk.parquet"
+
+# CA Blueprint for a Safer Economy cut-offs: minimal, moderate, substantial
+CASE_TIER_BOUNDS = (1, 4, 7)
+TEST_TIER_BOUNDS = (0.020, 0.050, 0.080)
+
+# 7-day windows with a 7-day lag: (exclusive start, inclusive end)
+TIME_PERIODS = {
+    "today": (one_week_ago, yesterday_date),
+    "one_week_ago": (two_weeks_ago, one_week_ago),
+    "two_weeks_ago": (three_weeks_ago, two_weeks_ago),
+}
+
 #---------------------------------------------------------------#
 # Case Rate (CA counties)
 #---------------------------------------------------------------#  
@@ -41,7 +55,7 @@ LA_POP = 10_257_557
 def case_rate(county_state_name, start_date, time_period):
     df = prep_case_rate(county_state_name, start_date, time_period)
     
-    pop = (pd.read_parquet(f'{S3_FILE_PATH_SOURCE}ca_county_pop_crosswalk.parquet')
+    pop = (dataset_cache.read_parquet(CA_POP_URL)
        .rename(columns = {"county_fips": "fips"})
         [["fips", "county_pop2020"]]
       )
@@ -127,3 +141,117 @@ def test_rate(start_date, time_period):
     tests_per100k = (tests_avg7 / LA_POP * POP_RATE).round(2).iloc[0]
     
     return tests_per100k
+
+
+
+#---------------------------------------------------------------#
+# Tier matrix (all CA counties, all time periods)
+#---------------------------------------------------------------#  
+def tier_matrix(start_date, case_bounds=CASE_TIER_BOUNDS, test_bounds=TEST_TIER_BOUNDS):
+    """
+    Case rate per 100k, test positivity and tier for every CA county 
+    and every time period, in one grouped computation.
+    
+    Test positivity is only available for LA County (our testing data),
+    and, like the summary table, only for the lagged periods. 
+    Other counties get NaN, and their overall tier is their case tier.
+    
+    Returns a long df: county, fips, time_period, metric, value
+    where metric is one of case_rate, test_positivity, case_tier, test_tier, overall_tier.
+    """
+    pop = (dataset_cache.read_parquet(CA_POP_URL)
+           .rename(columns = {"county_fips": "fips"})
+           [["county", "fips", "county_pop2020"]]
+          )
+    pop = pop.assign(fips = pop.fips.astype(str).str.zfill(5))
+    
+    # Prep all CA counties at once
+    county_names = [f"{county}, CA" for county in pop.county]
+    df = utils.prep_counties(county_names, start_date)
+    df = df.assign(time_period = assign_time_period(df.date))
+    
+    # Case rate: 7-day average of new cases, per 100k
+    case_rate = (df[df.time_period.notna()]
+                 .groupby(["fips", "time_period"], observed=True)
+                 .agg({"new_cases": "mean"})
+                 .reset_index()
+                 .merge(pop, on = "fips", how = "inner", validate = "m:1")
+                )
+    case_rate = case_rate.assign(
+        case_rate = (case_rate.new_cases.astype(float) / case_rate.county_pop2020 * POP_RATE).round(2)
+    )
+    
+    # Test positivity: LA County's testing data, lagged periods only
+    tests = utils.prep_testing(start_date)
+    tests = tests.assign(time_period = assign_time_period(tests.date))
+    tests = (tests[tests.time_period.isin(["one_week_ago", "two_weeks_ago"])]
+             .groupby("time_period")
+             .agg({"County_Positive": "sum", "County_Performed": "sum"})
+             .reset_index()
+            )
+    tests = tests.assign(
+        test_positivity = (tests.County_Positive / tests.County_Performed).astype(float).round(3),
+        county = "Los Angeles",
+    )
+
+    df = (pd.merge(case_rate[["county", "fips", "time_period", "case_rate"]], 
+                   tests[["county", "time_period", "test_positivity"]],
+                   on = ["county", "time_period"], how = "left", validate = "1:1")
+         )
+    
+    # Classify with array operations
+    # If 2 indicators belong in different tiers, most restrictive (max) is assigned overall
+    df = df.assign(
+        case_tier = classify_tiers(df.case_rate, case_bounds),
+        test_tier = classify_tiers(df.test_positivity, test_bounds),
+    )
+    df = df.assign(
+        overall_tier = df[["case_tier", "test_tier"]].max(axis=1)
+    )
+    
+    df = (df.melt(id_vars = ["county", "fips", "time_period"], 
+                  value_vars = ["case_rate", "test_positivity", 
+                                "case_tier", "test_tier", "overall_tier"],
+                  var_name = "metric")
+         )
+    df = (df.assign(
+            time_period = pd.Categorical(df.time_period, categories=list(TIME_PERIODS.keys()))
+          ).sort_values(["county", "time_period", "metric"])
+          .reset_index(drop=True)
+         )
+    
+    return df
+
+
+"""
+Sub-functions for tier matrix
+"""
+def assign_time_period(dates):
+    """
+    Label each date with the TIME_PERIODS window it falls in (None if outside all of them)
+    """
+    conditions = [(dates > start) & (dates <= end) for start, end in TIME_PERIODS.values()]
+    
+    labels = np.select(conditions, list(TIME_PERIODS.keys()), default=None)
+    
+    return pd.Series(labels, index=dates.index)
+
+
+def classify_tiers(values, bounds):
+    """
+    Vectorized tier assignment.
+    1 = minimal (below minimal bound), 2 = moderate, 
+    3 = substantial (up to and including substantial bound), 4 = widespread.
+    NaN stays NaN.
+    """
+    minimal_bound, moderate_bound, substantial_bound = bounds
+    values = pd.to_numeric(values).to_numpy(dtype="float64")
+    
+    conditions = [
+        values < minimal_bound,
+        (values >= minimal_bound) & (values < moderate_bound),
+        (values >= moderate_bound) & (values <= substantial_bound),
+        values > substantial_bound,
+    ]
+    
+    return np.select(conditions, [1, 2, 3, 4], default=np.nan)
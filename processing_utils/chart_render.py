@@ -0,0 +1,283 @@
+"""
+Render Altair charts / Vega-Lite specs to SVG in memory.
+
+make_charts.show_svg used to save each chart to `../notebooks/<name>.svg`
+with altair_saver, read it back to display it, and delete it.
+Here the SVG comes back as a string, with no temp file.
+
+vl-convert (if it's installed) compiles and renders in this process,
+on a JavaScript runtime that starts with the first chart and is reused
+for every chart after it, and it can render from several threads at once.
+Each vl-convert release bundles a fixed set of Vega-Lite versions
+(1.x dropped 4.17, which Altair 4 writes), so requirements.txt pins one
+that has ours. If the installed one doesn't, or it isn't installed,
+we fall back to altair_saver, one chart at a time.
+
+to_svg renders one chart, to_svgs renders a batch on a thread pool.
+Each notebook process gets its own converter.
+
+Rendered SVGs are cached on local disk (CACHE_DIR), keyed by a hash of
+the full spec (data, encodings, config) and the renderer. Most charts
+only change when their data does, so a county that didn't update
+is served from the cache. The cache is capped at MAX_CACHE_BYTES,
+least recently used SVGs are evicted first. cache_info() has the hit / miss counts.
+"""
+import glob
+import hashlib
+import json
+import os
+import threading
+import warnings
+
+from concurrent.futures import ThreadPoolExecutor
+
+import altair as alt
+
+from processing_utils import default_parameters
+
+try:
+    import vl_convert
+except ImportError:
+    vl_convert = None
+
+MAX_WORKERS = 4
+
+# Render with the same Vega-Lite version Altair writes specs for (v4.17.0 -> 4.17)
+VL_VERSION = ".".join(alt.SCHEMA_VERSION.lstrip("v").split(".")[:2])
+
+
+def vl_convert_supports(version):
+    """
+    True if the installed vl-convert bundles this Vega-Lite version.
+    """
+    versions = getattr(vl_convert, "get_vegalite_versions", None)
+    if versions is not None:
+        return version in versions()
+
+    # Older releases don't list them, try compiling an empty chart
+    try:
+        vl_convert.vegalite_to_vega({"mark": "point"}, vl_version=version)
+    except (RuntimeError, ValueError):
+        return False
+
+    return True
+
+
+if vl_convert is not None and not vl_convert_supports(VL_VERSION):
+    warnings.warn(
+        f"vl-convert {getattr(vl_convert, '__version__', '')} doesn't support "
+        f"Vega-Lite {VL_VERSION}, rendering with altair_saver instead"
+    )
+    vl_convert = None
+
+# Shared by every notebook process on this machine
+CACHE_DIR = os.path.join(default_parameters.CACHE_DIR, "charts")
+
+# Total size of cached SVGs we're willing to keep on disk (bytes)
+MAX_CACHE_BYTES = int(os.environ.get("CHART_CACHE_MAX_BYTES", 512 * 1024**2))
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+# Bytes on disk, counted the first time we write
+_cache_bytes = None
+
+# altair_saver shells out to node / selenium, which isn't safe to share across threads
+_saver_lock = threading.Lock()
+
+
+def backend():
+    return "vl-convert" if vl_convert is not None else "altair_saver"
+
+
+def to_spec(chart):
+    """
+    Vega-Lite spec (dict) for an Altair chart, or the spec itself.
+    """
+    if isinstance(chart, dict):
+        return chart
+
+    return chart.to_dict()
+
+
+def spec_key(spec):
+    """
+    Hash of the spec and what renders it.
+    """
+    version = getattr(vl_convert, "__version__", None)
+    h = hashlib.sha256(f"{backend()} {version} {VL_VERSION}".encode())
+    h.update(json.dumps(spec, sort_keys=True, default=str).encode())
+
+    return h.hexdigest()
+
+
+def render(spec):
+    """
+    SVG (str) for a Vega-Lite spec, without the cache.
+    """
+    if vl_convert is not None:
+        return vl_convert.vegalite_to_svg(spec, vl_version=VL_VERSION)
+
+    import altair_saver
+
+    with _saver_lock:
+        return altair_saver.save(spec, fmt="svg")
+
+
+def to_svg(chart):
+    """
+    SVG (str) for an Altair chart or Vega-Lite spec, from the cache if we've rendered it before.
+    """
+    spec = to_spec(chart)
+    key = spec_key(spec)
+
+    svg = read_cached(key)
+    if svg is None:
+        svg = render(spec)
+        write_cached(key, svg)
+
+    return svg
+
+
+def to_svgs(charts, max_workers=MAX_WORKERS):
+    """
+    Render many charts in one call.
+
+    charts: list of Altair charts / Vega-Lite specs, or dict of {name: chart}
+    Returns list of SVGs in the same order, or dict of {name: SVG}.
+    """
+    if isinstance(charts, dict):
+        return dict(zip(charts, to_svgs(list(charts.values()), max_workers)))
+
+    # to_dict is pure Python, threads wouldn't help there
+    specs = [to_spec(chart) for chart in charts]
+    keys = [spec_key(spec) for spec in specs]
+
+    svgs = {}
+    for key in keys:
+        if key not in svgs:
+            svgs[key] = read_cached(key)
+
+    # Identical charts get rendered once
+    missing = {key: spec for key, spec in zip(keys, specs) if svgs[key] is None}
+
+    if vl_convert is None or len(missing) < 2:
+        rendered = [render(spec) for spec in missing.values()]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers,
+                                thread_name_prefix="chart_render") as pool:
+            rendered = list(pool.map(render, missing.values()))
+
+    for key, svg in zip(missing, rendered):
+        write_cached(key, svg)
+        svgs[key] = svg
+
+    return [svgs[key] for key in keys]
+
+
+#---------------------------------------------------------------#
+# Cache
+#---------------------------------------------------------------#
+def _cache_path(key):
+    return os.path.join(CACHE_DIR, f"{key}.svg")
+
+
+def read_cached(key):
+    """
+    Cached SVG for key, or None. Counts a hit or a miss.
+    """
+    path = _cache_path(key)
+
+    try:
+        with open(path, "r") as f:
+            svg = f.read()
+        # Mark it recently used
+        os.utime(path)
+    except OSError:
+        with _lock:
+            _stats["misses"] += 1
+        return None
+
+    with _lock:
+        _stats["hits"] += 1
+
+    return svg
+
+
+def write_cached(key, svg):
+    """
+    Write to a temp file and rename, so another process never reads half an SVG.
+    The cache is an optimization, failing to write it doesn't fail the render.
+    """
+    global _cache_bytes
+
+    path = _cache_path(key)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmp_path, "w") as f:
+            f.write(svg)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+    except OSError:
+        return
+
+    with _lock:
+        if _cache_bytes is None:
+            _cache_bytes = sum(size for _, size, _ in _cached_files())
+        else:
+            _cache_bytes += size
+
+        if _cache_bytes > MAX_CACHE_BYTES:
+            _evict()
+
+
+def _cached_files():
+    files = []
+    for path in glob.glob(os.path.join(CACHE_DIR, "*.svg")):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        files.append((path, stat.st_size, stat.st_mtime))
+
+    return files
+
+
+def _evict():
+    """
+    Remove the least recently used SVGs until we're under the cap.
+    Recounts from disk, since other processes write here too.
+    """
+    global _cache_bytes
+
+    files = sorted(_cached_files(), key=lambda f: f[2])
+    total = sum(size for _, size, _ in files)
+
+    for path, size, _ in files:
+        if total <= MAX_CACHE_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+        _stats["evictions"] += 1
+
+    _cache_bytes = total
+
+
+def cache_info():
+    with _lock:
+        return {
+            **_stats,
+            "nbytes": _cache_bytes,
+            "max_bytes": MAX_CACHE_BYTES,
+        }
+
+
+def clear_cache_info():
+    with _lock:
+        for k in _stats:
+            _stats[k] = 0
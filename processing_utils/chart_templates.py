@@ -0,0 +1,194 @@
+"""
+Vega-Lite spec templates for the charts we draw once per geography.
+
+Building a layered Altair chart and calling to_dict() means constructing
+dozens of schema objects and validating the whole spec, inline data included,
+for every county and neighborhood. But from one geography to the next,
+only the data, titles and a few numbers (like the y-axis max) change.
+
+spec() builds the chart once per chart type with placeholders in those places,
+validates it, and remembers where each placeholder ended up.
+After that, a geography's spec is the skeleton with its values filled in,
+the same dict to_dict() would have given us.
+
+Altair names each inline dataset with a hash of its values, and the hash
+changed between Altair versions. We compute it ourselves, and check our name
+against the one Altair gave the placeholder data. If none of the known schemes
+match, that chart type is built with to_dict() every time instead.
+"""
+import hashlib
+import json
+
+import altair as alt
+import numpy as np
+import pandas as pd
+
+# Column added to placeholder data, so we can tell which dataset is which
+SLOT_COL = "__template_slot__"
+
+# Placeholder numbers, unlikely to show up in a real spec
+NUMBER_PLACEHOLDER = -8.765432e-123
+
+_templates = {}
+
+
+def spec(name, build, **values):
+    """
+    Vega-Lite spec (dict) for build(**values), the same as build(**values).to_dict().
+
+    name: str, the chart type
+    build: function(**values) returning an Altair chart.
+            It has to use DataFrame values as chart data, and str / number values
+            as they are (in titles, scale domains, etc), without computing on them.
+    values: DataFrames, str or numbers.
+    """
+    frames = [v for v in values.values() if isinstance(v, pd.DataFrame)]
+
+    # Placeholder data needs a row to tell datasets apart
+    if any(len(df) == 0 for df in frames):
+        return build(**values).to_dict()
+
+    key = (name,) + tuple((slot, _value_type(value)) for slot, value in sorted(values.items()))
+
+    if key not in _templates:
+        _templates[key] = compile_template(build, values)
+
+    template = _templates[key]
+    if template is None:
+        return build(**values).to_dict()
+
+    return fill(template, values)
+
+
+def _value_type(value):
+    # Column types decide how Altair encodes shorthand like "date2", so they're part of the key
+    if isinstance(value, pd.DataFrame):
+        return tuple((str(c), str(t)) for c, t in value.dtypes.items())
+
+    if isinstance(value, str):
+        return "str"
+
+    if isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+        return "number"
+
+    raise TypeError(f"Template values are DataFrames, str or numbers, not {type(value)}")
+
+
+def compile_template(build, values):
+    """
+    Build the chart with a placeholder for each value, validating it once.
+    Returns (skeleton spec, placeholders, dataset naming function),
+    where placeholders maps slot -> placeholder.
+    Returns None if we can't name datasets the way this Altair does.
+    """
+    placeholders = {}
+    for i, (slot, value) in enumerate(sorted(values.items())):
+        if isinstance(value, pd.DataFrame):
+            placeholders[slot] = value.iloc[:1].assign(**{SLOT_COL: slot})
+        elif isinstance(value, str):
+            placeholders[slot] = f"\x00{slot}\x00"
+        else:
+            placeholders[slot] = NUMBER_PLACEHOLDER * (i + 1)
+
+    skeleton = build(**placeholders).to_dict()
+
+    datasets = skeleton.get("datasets", {})
+    dataset_name = _naming_scheme(datasets)
+    if datasets and dataset_name is None:
+        return None
+
+    # Placeholder data -> the name Altair gave its dataset
+    for name, records in datasets.items():
+        if records and SLOT_COL in records[0]:
+            placeholders[records[0][SLOT_COL]] = name
+
+    return skeleton, placeholders, dataset_name
+
+
+def fill(template, values):
+    skeleton, placeholders, dataset_name = template
+
+    datasets = {}
+    names = {}
+    strings = {}
+    numbers = {}
+
+    for slot, value in values.items():
+        placeholder = placeholders[slot]
+
+        if isinstance(value, pd.DataFrame):
+            # Exactly what Altair would inline (sanitized records), under the name it would give them
+            records = alt.data_transformers.get()(value)["values"]
+            name = dataset_name(records)
+            names[placeholder] = name
+            datasets[placeholder] = (name, records)
+        elif isinstance(value, str):
+            strings[placeholder] = value
+        else:
+            numbers[placeholder] = value.item() if isinstance(value, np.generic) else value
+
+    def walk(node):
+        if isinstance(node, dict):
+            return {k: walk(v) for k, v in node.items()}
+        if isinstance(node, list):
+            return [walk(v) for v in node]
+        if isinstance(node, str):
+            if node in names:
+                return names[node]
+            for placeholder, value in strings.items():
+                if placeholder in node:
+                    node = node.replace(placeholder, value)
+            return node
+        if isinstance(node, float) and node in numbers:
+            return numbers[node]
+        return node
+
+    filled = walk({k: v for k, v in skeleton.items() if k != "datasets"})
+
+    if "datasets" in skeleton:
+        filled["datasets"] = {}
+        for name, records in skeleton["datasets"].items():
+            if name in datasets:
+                new_name, records = datasets[name]
+                filled["datasets"][new_name] = records
+            else:
+                filled["datasets"][name] = records
+
+    return filled
+
+
+#---------------------------------------------------------------#
+# Dataset names
+#---------------------------------------------------------------#
+# How Altair names an inline dataset from its (sanitized) records
+def _md5_name(records):
+    # Altair 4
+    if records == [{}]:
+        return "empty"
+
+    values_json = json.dumps(records, sort_keys=True)
+    return "data-" + hashlib.md5(values_json.encode()).hexdigest()
+
+
+def _sha256_name(records):
+    # Altair 5 and later
+    if records == [{}]:
+        return "empty"
+
+    values_json = json.dumps(records, sort_keys=True, default=str)
+    return "data-" + hashlib.sha256(values_json.encode()).hexdigest()[:32]
+
+
+NAMING_SCHEMES = [_md5_name, _sha256_name]
+
+
+def _naming_scheme(datasets):
+    """
+    The naming function that gives every dataset in a compiled spec its name,
+    or None if none of them do.
+    """
+    for dataset_name in NAMING_SCHEMES:
+        if all(dataset_name(records) == name for name, records in datasets.items()):
+            return dataset_name
+
+    return None
@@ -0,0 +1,144 @@
+"""
+In-process cache for the parquet artifacts we keep in S3.
+
+The same `us-county-time-series.parquet` gets read a dozen times
+in a single notebook run (prep_county, prep_state, prep_msa, clean_jhu...).
+Read it once, normalize it once, and hand out the cached frame
+until the object in S3 changes.
+
+Entries are keyed by object URL + ETag/version, so a new upload
+is picked up automatically. Memory is capped, least recently used
+frames are evicted first.
+"""
+import os
+import threading
+import time
+
+import fsspec
+import pandas as pd
+
+from collections import OrderedDict
+
+# Total size of cached frames we're willing to hold (bytes)
+MAX_CACHE_BYTES = int(os.environ.get("DATASET_CACHE_MAX_BYTES", 2 * 1024**3))
+
+# Only go back to S3 to check the ETag if the entry is older than this (seconds)
+# A HEAD request is cheap, but there's no need to make one on every prep_* call
+FRESHNESS_CHECK_SECONDS = int(os.environ.get("DATASET_CACHE_CHECK_SECONDS", 300))
+
+_lock = threading.RLock()
+_entries = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def object_version(url):
+    """
+    Cheap freshness check: ask the filesystem for the object's metadata.
+    S3 gives us ETag (and VersionId if the bucket is versioned),
+    local files give us mtime and size.
+    For a directory (partitioned dataset), it's the version of every file in it.
+    """
+    fs, path = fsspec.core.url_to_fs(url)
+    info = fs.info(path)
+
+    # Partitioned dataset: combine the versions of all its files (1 LIST request)
+    if info.get("type") == "directory":
+        files = fs.find(path, detail=True)
+        return tuple((name, _file_version(files[name])) for name in sorted(files))
+
+    return _file_version(info)
+
+
+def _file_version(info):
+    version_keys = ["ETag", "VersionId", "LastModified", "mtime", "size"]
+    version = tuple(str(info.get(k)) for k in version_keys if info.get(k) is not None)
+
+    return version
+
+
+def read_parquet(url, normalize=None, **kwargs):
+    """
+    Read a parquet from S3 (or any fsspec path) through the cache.
+
+    url: str, path to parquet
+    normalize: function, applied once to the frame after it's read
+                (parse dates, add columns, etc). Callers get the normalized frame.
+    kwargs: passed to pd.read_parquet (columns, filters).
+
+    Treat the returned frame as read-only; assign / merge / subset
+    produce new frames, which is how all our prep_* functions use it.
+    """
+    key = (url, _callable_name(normalize), repr(sorted(kwargs.items())))
+    now = time.time()
+
+    with _lock:
+        entry = _entries.get(key)
+
+        if entry is not None and (now - entry["checked"]) < FRESHNESS_CHECK_SECONDS:
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return entry["df"].copy(deep=False)
+
+    version = object_version(url)
+
+    with _lock:
+        entry = _entries.get(key)
+
+        if entry is not None and entry["version"] == version:
+            entry["checked"] = now
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return entry["df"].copy(deep=False)
+
+    # Not cached, or the object was overwritten since we last read it
+    df = pd.read_parquet(url, **kwargs)
+    if normalize is not None:
+        df = normalize(df)
+
+    nbytes = int(df.memory_usage(deep=True).sum())
+
+    with _lock:
+        _stats["misses"] += 1
+        _entries.pop(key, None)
+
+        # Don't cache something that would blow the cap all by itself
+        if nbytes <= MAX_CACHE_BYTES:
+            _entries[key] = {"df": df, "version": version,
+                             "nbytes": nbytes, "checked": now}
+            _evict()
+
+    return df.copy(deep=False)
+
+
+def _evict():
+    total = sum(e["nbytes"] for e in _entries.values())
+
+    while total > MAX_CACHE_BYTES and _entries:
+        _, entry = _entries.popitem(last=False)
+        total -= entry["nbytes"]
+        _stats["evictions"] += 1
+
+
+def _callable_name(func):
+    if func is None:
+        return None
+    return f"{func.__module__}.{func.__qualname__}"
+
+
+def invalidate(url=None):
+    """
+    Drop cached frames for a URL, or everything if url is None.
+    """
+    with _lock:
+        for key in [k for k in _entries if url is None or k[0] == url]:
+            del _entries[key]
+
+
+def cache_info():
+    with _lock:
+        return {
+            **_stats,
+            "entries": len(_entries),
+            "nbytes": sum(e["nbytes"] for e in _entries.values()),
+            "max_bytes": MAX_CACHE_BYTES,
+        }
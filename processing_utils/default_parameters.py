@@ -29,6 +29,12 @@ if "CURRENT_BRANCH" in env_list:
 else:
     CURRENT_BRANCH="test"
 
+# Local cache root (population crosswalk, source downloads, rendered charts)
+CACHE_DIR = os.environ.get(
+    "COVID19_INDICATORS_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "covid19-indicators")
+)
+
 county_state_name = "Los Angeles, CA"
 state_name = "California"
 msa_name = "Los Angeles-Long Beach-Anaheim, CA"
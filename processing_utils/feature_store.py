@@ -0,0 +1,227 @@
+"""
+Build the derived tables the report notebooks share, once a day.
+
+The notebooks each rebuilt the same tables (clean_jhu, clean_hospitalizations,
+clean_vaccines_by_county, the neighborhood case and testing data),
+and ca-counties and us-counties both cleaned the full national JHU data.
+build_all() materializes them as parquet in STORE_URL, and the clean_*
+functions read the stored table instead, as long as it's fresh.
+
+Each table is stored with a stamp (`{table}.json`): the day it was built for,
+the versions (ETag / mtime) of the artifacts it was built from,
+and the version of the table we wrote. A table is fresh if it was built
+today, from the same inputs, and hasn't been overwritten since.
+Anything else, the clean_* function does the work itself, like before.
+"""
+import importlib
+import json
+import os
+import time
+
+import fsspec
+
+from processing_utils import artifacts
+from processing_utils import dataset_cache
+from processing_utils import default_parameters
+from processing_utils import schemas
+
+from datetime import date
+
+S3_FILE_PATH = default_parameters.S3_FILE_PATH
+S3_FILE_PATH_SOURCE = default_parameters.S3_FILE_PATH_SOURCE
+
+# Any fsspec URL, local disk works too
+STORE_URL = os.environ.get("FEATURE_STORE_URL", f"{S3_FILE_PATH}feature-store")
+
+# name: build function ("module:function", so it's only imported when it's built),
+#     artifacts it reads (inputs),
+#     and the keyword arguments the notebooks call it with (one table for each)
+FEATURES = {
+    "clean_jhu": {
+        "build": "processing_utils.us_county_utils:build_clean_jhu",
+        "inputs": [schemas.SCHEMAS["us-county-time-series"]["url"]],
+        "params": [
+            {"start_date": default_parameters.start_date},
+            # us-counties.ipynb
+            {"start_date": date(2021, 3, 1)},
+        ],
+    },
+    "clean_hospitalizations": {
+        "build": "processing_utils.us_county_utils:build_clean_hospitalizations",
+        "inputs": [schemas.SCHEMAS["ca-hospital-and-surge-capacity"]["url"]],
+        "params": [{"start_date": default_parameters.start_date}],
+    },
+    # Also downloads the CA open data vaccine CSV, which has no version we can check.
+    # Being built today is as fresh as it gets.
+    "clean_vaccines_by_county": {
+        "build": "processing_utils.utils:build_clean_vaccines_by_county",
+        "inputs": [schemas.SCHEMAS["ca_county_pop_crosswalk"]["url"]],
+        "params": [{}],
+    },
+    "neighborhood_clean_data": {
+        "build": "processing_utils.neighborhood_utils:build_clean_data",
+        "inputs": [
+            schemas.SCHEMAS["la-county-neighborhood-time-series"]["url"],
+            schemas.SCHEMAS["la_neighborhoods_population_crosswalk"]["url"],
+        ],
+        "params": [{}],
+    },
+    "neighborhood_clean_testing_data": {
+        "build": "processing_utils.neighborhood_utils:build_clean_testing_data",
+        "inputs": [
+            f"{S3_FILE_PATH_SOURCE}la-county-neighborhood-testing-appended.parquet",
+            schemas.SCHEMAS["la_neighborhoods_population_crosswalk"]["url"],
+        ],
+        "params": [{}],
+    },
+}
+
+
+#---------------------------------------------------------------#
+# Paths and stamps
+#---------------------------------------------------------------#
+def table_name(name, params):
+    """
+    clean_jhu + {"start_date": date(2021, 3, 1)} -> clean_jhu_2021-03-01
+    """
+    return "_".join([name] + [str(params[k]) for k in sorted(params)])
+
+
+def table_path(name, params):
+    return f"{STORE_URL}/{table_name(name, params)}.parquet"
+
+
+def stamp_path(name, params):
+    return f"{STORE_URL}/{table_name(name, params)}.json"
+
+
+def current_stamp(name, params):
+    """
+    What the stamp of a fresh table looks like, minus the table's own version and dtypes.
+    """
+    return {
+        "as_of": str(default_parameters.today_date),
+        "params": {k: str(v) for k, v in params.items()},
+        "inputs": {path: artifacts.object_version(path) for path in FEATURES[name]["inputs"]},
+    }
+
+
+def read_stamp(name, params):
+    try:
+        with fsspec.open(stamp_path(name, params), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_stamp(name, params, stamp):
+    fs, fs_path = fsspec.core.url_to_fs(stamp_path(name, params))
+    fs.makedirs(fs_path.rsplit("/", 1)[0], exist_ok=True)
+
+    with fs.open(fs_path, "w") as f:
+        json.dump(stamp, f)
+
+
+def is_fresh(name, params):
+    stamp = read_stamp(name, params)
+    if stamp is None:
+        return False
+
+    version = stamp.pop("version", None)
+    stamp.pop("dtypes", None)
+
+    return (stamp == current_stamp(name, params) and
+            version is not None and version == artifacts.object_version(table_path(name, params)))
+
+
+#---------------------------------------------------------------#
+# Read
+#---------------------------------------------------------------#
+def read(name, **params):
+    """
+    The stored table for name and params if it's fresh, otherwise None.
+    Callers build it themselves when they get None.
+    """
+    if name not in FEATURES or params not in FEATURES[name]["params"]:
+        return None
+
+    if not is_fresh(name, params):
+        return None
+
+    df = dataset_cache.read_parquet(table_path(name, params))
+
+    # Parquet has no second-resolution timestamps, give back what was built
+    dtypes = read_stamp(name, params)["dtypes"]
+    changed = {c: t for c, t in dtypes.items() if str(df[c].dtype) != t}
+
+    return df.astype(changed) if changed else df
+
+
+#---------------------------------------------------------------#
+# Build
+#---------------------------------------------------------------#
+def materialize(name, params):
+    """
+    Build one table and store it with its stamp.
+    Input versions are taken before building, so an input that changes
+    while we build makes the table stale instead of wrongly fresh.
+    """
+    stamp = current_stamp(name, params)
+
+    module_name, func_name = FEATURES[name]["build"].split(":")
+    build = getattr(importlib.import_module(module_name), func_name)
+    df = build(**params)
+
+    fs, fs_path = fsspec.core.url_to_fs(STORE_URL)
+    fs.makedirs(fs_path, exist_ok=True)
+
+    path = table_path(name, params)
+    artifacts.write_parquet(df, path)
+
+    stamp["version"] = artifacts.object_version(path)
+    stamp["dtypes"] = {str(c): str(t) for c, t in df.dtypes.items()}
+    write_stamp(name, params, stamp)
+
+    return df
+
+
+def build_all(names=None, force=False):
+    """
+    Materialize every table that isn't fresh.
+
+    names: list of keys in FEATURES. Defaults to all of them.
+    force: bool. If True, rebuild tables that are fresh too.
+
+    Returns dict of {table name: "built" or "fresh"}.
+    Raises the first build's error, after trying the rest.
+    """
+    results = {}
+    errors = []
+
+    for name in names or FEATURES:
+        for params in FEATURES[name]["params"]:
+            key = table_name(name, params)
+
+            if not force and is_fresh(name, params):
+                results[key] = "fresh"
+                continue
+
+            start = time.perf_counter()
+            try:
+                materialize(name, params)
+            except Exception as e:
+                errors.append(e)
+                results[key] = f"failed: {e!r}"
+                continue
+
+            results[key] = "built"
+            print(f"{key}: built ({time.perf_counter() - start:.1f}s)")
+
+    for key, result in results.items():
+        if result != "built":
+            print(f"{key}: {result}")
+
+    if errors:
+        raise errors[0]
+
+    return results
@@ -0,0 +1,369 @@
+"""
+Concurrent downloads for ETL source files.
+
+An ETL job's sources (JHU CSVs and lookup table, ESRI feature layers,
+CA open data CSVs) don't depend on each other, but pd.read_csv / gpd.read_file
+downloaded them one after another. Here they're requested together on
+a thread pool, over one pooled requests.Session with retries and backoff.
+Bodies are streamed to disk as they arrive, never held whole in memory,
+and loaders read them back as files (Source.open), or as bytes for the
+small ones (Source.content).
+
+Each ETL job fetches all of its sources at once, and task_graph runs
+the jobs side by side, so a run waits about as long as the slowest download.
+
+Bodies are cached (CACHE_URL) with their ETag / Last-Modified, and the
+next download is a conditional GET: a 304 is served from the cache.
+Each download comes back as a Source with a version (hash of its content),
+so an ETL job can tell its sources haven't moved since it last wrote
+its outputs (already_processed / mark_processed) and skip the work.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import fsspec
+import fsspec.implementations.local
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from processing_utils import default_parameters
+
+MAX_WORKERS = 8
+
+# Retry connection errors and these statuses, waiting 1, 2, 4, 8 seconds
+RETRIES = 4
+BACKOFF_FACTOR = 1
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+# (connect, read) seconds
+TIMEOUT = (10, 300)
+
+# Bytes streamed / hashed at a time
+CHUNK_SIZE = 1 << 20
+
+# Where bodies, validators and processed versions are kept between runs,
+# under the same cache root as everything else (COVID19_INDICATORS_CACHE_DIR).
+# Any fsspec URL, set SOURCE_CACHE_URL to point it at S3 and share it across containers.
+CACHE_URL = os.environ.get(
+    "SOURCE_CACHE_URL", os.path.join(default_parameters.CACHE_DIR, "sources"))
+
+class Source(namedtuple("Source", ["path", "version", "not_modified"])):
+    """
+    A downloaded source file.
+
+    path: where the body is (the cache, or the url itself for S3 / local paths)
+    version: sha256 of the body
+    not_modified: True if the server answered our conditional GET with a 304
+    """
+    __slots__ = ()
+
+    def open(self):
+        """
+        The body as a binary file object, read as it's parsed.
+        """
+        return fsspec.open(self.path, "rb").open()
+
+    @property
+    def content(self):
+        """
+        The whole body as bytes, for sources small enough to hold in memory.
+        """
+        with self.open() as f:
+            return f.read()
+
+_lock = threading.Lock()
+_session = None
+_executor = None
+
+# url: Future for downloads started by prefetch() and not picked up yet
+_pending = {}
+
+
+def get_session():
+    """
+    One requests.Session for every download, so connections are reused.
+    """
+    global _session
+
+    with _lock:
+        if _session is None:
+            retry = Retry(
+                total=RETRIES,
+                backoff_factor=BACKOFF_FACTOR,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=["GET"],
+            )
+            adapter = HTTPAdapter(pool_connections=MAX_WORKERS,
+                                  pool_maxsize=MAX_WORKERS, max_retries=retry)
+
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+
+    return _session
+
+
+def _get_executor():
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS,
+                                       thread_name_prefix="fetch")
+
+    return _executor
+
+
+def file_version(path):
+    """
+    sha256 of a file, read a chunk at a time
+    """
+    h = hashlib.sha256()
+    with fsspec.open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def download(url):
+    """
+    Source for url. http(s) goes through the pooled session as a conditional GET,
+    streaming the body into the cache. Anything else (S3, local paths)
+    is read in place through fsspec.
+    """
+    if not url.startswith(("http://", "https://")):
+        return Source(url, file_version(url), False)
+
+    meta = read_cached(url)
+
+    headers = {}
+    if meta is not None:
+        if meta["etag"] is not None:
+            headers["If-None-Match"] = meta["etag"]
+        if meta["last_modified"] is not None:
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    with get_session().get(url, headers=headers, timeout=TIMEOUT, stream=True) as response:
+        if response.status_code == 304 and meta is not None:
+            body_path, _ = _cache_paths(url)
+            return Source(body_path, meta["version"], True)
+
+        response.raise_for_status()
+        path, version, size = write_body(url, response)
+
+    if path == _cache_paths(url)[0]:
+        write_cached(url, {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "version": version,
+            "size": size,
+        })
+
+    return Source(path, version, False)
+
+
+#---------------------------------------------------------------#
+# Cache
+#---------------------------------------------------------------#
+def _cache_paths(url):
+    key = hashlib.sha256(url.encode()).hexdigest()
+    return f"{CACHE_URL}/{key}.body", f"{CACHE_URL}/{key}.json"
+
+
+def _read_json(path):
+    try:
+        with fsspec.open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, obj):
+    fs, fs_path = fsspec.core.url_to_fs(path)
+    fs.makedirs(os.path.dirname(fs_path), exist_ok=True)
+
+    with fs.open(fs_path, "w") as f:
+        json.dump(obj, f)
+
+
+def read_cached(url):
+    """
+    Metadata from the last download of url, or None.
+    The body's digest is recorded in the metadata when it's written,
+    so it isn't hashed again here; a body that's missing or isn't
+    the recorded size is ignored.
+    """
+    body_path, meta_path = _cache_paths(url)
+
+    meta = _read_json(meta_path)
+    if meta is None or "size" not in meta:
+        return None
+
+    try:
+        fs, fs_path = fsspec.core.url_to_fs(body_path)
+        if fs.size(fs_path) != meta["size"]:
+            return None
+    except OSError:
+        return None
+
+    return meta
+
+
+def write_body(url, response):
+    """
+    Stream the response body into the cache, hashing it as it goes.
+
+    On local disk it's written to a temp file next to the cached body,
+    and only replaces it once the download is complete, after the old
+    metadata is removed. An interrupted download leaves the old entry
+    or none, never a truncated body its metadata vouches for.
+    Object stores like S3 only create the object when the upload completes,
+    there the old metadata is removed before it starts.
+    If the cache can't be opened, the body goes to a local temp file instead.
+
+    Returns (path, version, size).
+    """
+    path, meta_path = _cache_paths(url)
+    fs, fs_path = fsspec.core.url_to_fs(path)
+    local = isinstance(fs, fsspec.implementations.local.LocalFileSystem)
+
+    try:
+        fs.makedirs(os.path.dirname(fs_path), exist_ok=True)
+        if local:
+            f = tempfile.NamedTemporaryFile(dir=os.path.dirname(fs_path),
+                                            suffix=".part", delete=False)
+        else:
+            _remove(meta_path)
+            f = fs.open(fs_path, "wb")
+    except OSError:
+        f = tempfile.NamedTemporaryFile(suffix=".body", delete=False)
+        path = f.name
+        local = False
+
+    h = hashlib.sha256()
+    size = 0
+    try:
+        with f:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                h.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        if local:
+            os.remove(f.name)
+        raise
+
+    if local:
+        _remove(meta_path)
+        os.replace(f.name, fs_path)
+
+    return path, h.hexdigest(), size
+
+
+def _remove(path):
+    try:
+        fs, fs_path = fsspec.core.url_to_fs(path)
+        fs.rm(fs_path)
+    except (OSError, FileNotFoundError):
+        pass
+
+
+def write_cached(url, meta):
+    """
+    Metadata, written after the body, so a partial write is never trusted.
+    The cache is an optimization, failing to write it doesn't fail the download.
+    """
+    _, meta_path = _cache_paths(url)
+
+    try:
+        _write_json(meta_path, meta)
+    except OSError:
+        pass
+
+
+#---------------------------------------------------------------#
+# Skip unchanged sources
+#---------------------------------------------------------------#
+def _processed_path(job):
+    return f"{CACHE_URL}/processed/{job}.json"
+
+
+def _processed_record(sources, depends_on):
+    versions = {name: source.version for name, source in sources.items()}
+    return {"versions": versions, "depends_on": depends_on}
+
+
+def already_processed(job, sources, depends_on=None):
+    """
+    True if job last finished with exactly these source versions.
+
+    job: str, name of the ETL job
+    sources: dict of {name: Source}, from fetch_all
+    depends_on: str, anything else the job's outputs depend on (like today's date).
+    """
+    record = _processed_record(sources, depends_on)
+
+    return _read_json(_processed_path(job)) == record
+
+
+def mark_processed(job, sources, depends_on=None):
+    """
+    Record the source versions job just wrote its outputs from.
+    Call it after the writes, so a failed run is redone next time.
+    """
+    try:
+        _write_json(_processed_path(job), _processed_record(sources, depends_on))
+    except OSError:
+        pass
+
+
+#---------------------------------------------------------------#
+# Concurrent downloads
+#---------------------------------------------------------------#
+def prefetch(urls):
+    """
+    Start downloading urls in the background and return right away.
+    fetch_all() picks up the results. A URL that's already downloading
+    isn't requested twice.
+    """
+    with _lock:
+        executor = _get_executor()
+        for url in urls:
+            if url not in _pending:
+                _pending[url] = executor.submit(download, url)
+
+
+def fetch_all(urls):
+    """
+    Download urls concurrently, or wait on the ones already prefetched.
+
+    urls: dict of {name: url}
+    Returns dict of {name: Source}. Raises the first download's error, if any.
+    """
+    with _lock:
+        executor = _get_executor()
+        futures = {}
+        for url in set(urls.values()):
+            future = _pending.pop(url, None)
+            futures[url] = future or executor.submit(download, url)
+
+    results = {url: future.result() for url, future in futures.items()}
+
+    return {name: results[url] for name, url in urls.items()}
+
+
+def fetch(url):
+    """
+    Source for url, waiting on a prefetched download if there is one.
+    """
+    return fetch_all({url: url})[url]
@@ -1,15 +1,25 @@
 #!/bin/python
 import base64
 import github
+import hashlib
 #import sys
 import os 
+import requests
 import s3fs
 
+from concurrent.futures import ThreadPoolExecutor
+
 DEFAULT_COMMITTER = {
     "name": "Los Angeles ITA data team",
     "email": "ITAData@lacity.org",
 }
 
+# Blobs hashed / uploaded at once
+MAX_WORKERS = 4
+
+# Bytes read at a time. A multiple of 3, so each chunk base64-encodes on its own.
+CHUNK_SIZE = 3 * 2**20
+
 def upload_file(
         auth_token,
         repo_name,
@@ -21,30 +31,187 @@ def upload_file(
         #repo_file_mode valid values: "100644", "100755", "040000", "160000", "120000"
         repo_file_mode="100644",
         timeout=1800):
-    if local_path[0:5].lower()=="s3://":
-        fs=s3fs.S3FileSystem(anon=False)
-        assert fs.exists(local_path), f"local_path = {local_path} does not exist"
-        file=fs.open(local_path,"rb").read()
-    else:
-        assert os.path.exists(local_path), f"local_path = {local_path} does not exist"
-        file=open(local_path,"rb").read()
-    #print(auth_token)
-    #print(timeout)
+    return upload_files(
+        auth_token,
+        repo_name,
+        branch,
+        {local_path: repo_path},
+        commit_message,
+        commit_author,
+        repo_file_mode,
+        timeout)
+
+
+def upload_files(
+        auth_token,
+        repo_name,
+        branch,
+        files,
+        commit_message,
+        commit_author=DEFAULT_COMMITTER,
+        repo_file_mode="100644",
+        timeout=1800,
+        max_workers=MAX_WORKERS):
+    """
+    Upload many files to branch in 1 commit.
+
+    files: dict of {local_path (local or s3://): repo_path}
+    Files whose content is already on branch (same git blob SHA) are skipped,
+    and if none changed, nothing is committed. The rest are uploaded concurrently,
+    then there's 1 tree, 1 commit and 1 ref update for the whole batch.
+    If the branch moved while we were committing, we commit again on top of it, once.
+    Returns the commit, or None if nothing changed.
+    """
+    for local_path in files:
+        assert file_exists(local_path), f"local_path = {local_path} does not exist"
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        shas=dict(zip(files, pool.map(blob_sha, files)))
+
     g=github.Github(login_or_token=auth_token,timeout=timeout)
     repo=g.get_repo(repo_name)
-    ref=repo.get_git_ref(f"heads/{branch}")
-    last_commit=repo.get_git_commit(ref.object.sha)
-    file=base64.b64encode(file)
-    file=str(file,"ascii")
-    blob1=repo.create_git_blob(file,"base64")
     author=github.InputGitAuthor(
             commit_author["name"],
             commit_author["email"])
-    treeEl=github.InputGitTreeElement(
-            repo_path,repo_file_mode,"blob",sha=blob1.sha)
-    tree=repo.create_git_tree([treeEl],last_commit.tree)
-    thiscommit=repo.create_git_commit(
-        commit_message,tree,
-        [last_commit],
-        committer=author)
-    ref.edit(thiscommit.sha)
+    uploaded=set()
+
+    def upload_blob(local_path):
+        sha=create_blob(repo.url,auth_token,local_path,timeout)
+        assert sha==shas[local_path], f"{local_path} changed while uploading"
+        return sha
+
+    for attempt in range(2):
+        ref=repo.get_git_ref(f"heads/{branch}")
+        last_commit=repo.get_git_commit(ref.object.sha)
+
+        existing=tree_shas(repo,last_commit.tree.sha)
+        changed=[local_path for local_path, repo_path in files.items()
+                 if existing.get(repo_path)!=shas[local_path]]
+
+        for local_path in files:
+            if local_path not in changed:
+                print(f"{files[local_path]} unchanged, skipping")
+        if not changed:
+            return None
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            # Identical files are 1 blob
+            to_upload={shas[p]: p for p in changed if shas[p] not in uploaded}
+            uploaded.update(pool.map(upload_blob, to_upload.values()))
+
+        tree_elements=[
+            github.InputGitTreeElement(files[local_path],repo_file_mode,"blob",sha=shas[local_path])
+            for local_path in changed
+        ]
+        tree=repo.create_git_tree(tree_elements,last_commit.tree)
+        thiscommit=repo.create_git_commit(
+            commit_message,tree,
+            [last_commit],
+            committer=author)
+        try:
+            ref.edit(thiscommit.sha)
+            return thiscommit
+        except github.GithubException as e:
+            # Not a fast-forward: another upload committed to branch after we read it.
+            # Compare against that commit instead, uploaded blobs aren't uploaded again.
+            if attempt == 1 or e.status not in (409, 422):
+                raise
+            print(f"{branch} moved while committing, retrying")
+
+
+def tree_shas(repo, tree_sha):
+    """
+    {repo_path: blob SHA} for every file in the tree.
+    """
+    tree=repo.get_git_tree(tree_sha,recursive=True)
+
+    return {element.path: element.sha for element in tree.tree if element.type=="blob"}
+
+
+#---------------------------------------------------------------#
+# Streaming blobs
+#---------------------------------------------------------------#
+def blob_sha(local_path):
+    """
+    Git blob SHA of the file (sha1 of "blob {size}\\0" + content), read a chunk at a time.
+    """
+    h=hashlib.sha1(f"blob {file_size(local_path)}\0".encode())
+    with open_file(local_path) as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+class Base64Body:
+    """
+    JSON body for the create blob API, base64-encoded a chunk at a time as it's sent.
+    Its length is known up front, so requests sends a Content-Length instead of chunking.
+    """
+    prefix=b'{"encoding": "base64", "content": "'
+    suffix=b'"}'
+
+    def __init__(self, local_path):
+        self.local_path=local_path
+        self.size=file_size(local_path)
+
+    def __len__(self):
+        return len(self.prefix)+4*((self.size+2)//3)+len(self.suffix)
+
+    def __iter__(self):
+        yield self.prefix
+        with open_file(self.local_path) as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                yield base64.b64encode(chunk)
+        yield self.suffix
+
+
+def create_blob(repo_url, auth_token, local_path, timeout=1800):
+    """
+    Upload the file as a blob, without the whole file (or its base64) in memory.
+    PyGithub's create_git_blob takes the content as 1 str, so this posts to the API directly.
+    Returns the blob SHA.
+    """
+    response=requests.post(
+        f"{repo_url}/git/blobs",
+        data=Base64Body(local_path),
+        headers={
+            "Authorization": f"token {auth_token}",
+            "Accept": "application/vnd.github+json",
+            "Content-Type": "application/json",
+        },
+        timeout=timeout)
+    response.raise_for_status()
+
+    return response.json()["sha"]
+
+
+#---------------------------------------------------------------#
+# Local / S3 files
+#---------------------------------------------------------------#
+def is_s3(local_path):
+    return local_path[0:5].lower()=="s3://"
+
+
+def file_exists(local_path):
+    if is_s3(local_path):
+        fs=s3fs.S3FileSystem(anon=False)
+        return fs.exists(local_path)
+
+    return os.path.exists(local_path)
+
+
+def file_size(local_path):
+    if is_s3(local_path):
+        fs=s3fs.S3FileSystem(anon=False)
+        return fs.size(local_path)
+
+    return os.path.getsize(local_path)
+
+
+def open_file(local_path):
+    if is_s3(local_path):
+        fs=s3fs.S3FileSystem(anon=False)
+        return fs.open(local_path,"rb")
+
+    return open(local_path,"rb")
@@ -0,0 +1,85 @@
+"""
+Columnar growth metrics on cumulative cases:
+doubling time, growth rate, and days since reaching a threshold.
+
+Everything is computed over grouped NumPy arrays after one sort,
+and several windows are done in the same pass.
+"""
+import numpy as np
+import pandas as pd
+
+from processing_utils import array_utils
+
+# Start counting day 1 as when 100 cases is reached
+CASES_THRESHOLD = 100
+
+
+def above_threshold(df, value_col="cases", threshold=CASES_THRESHOLD):
+    """
+    1 if value_col >= threshold, 0 otherwise (including missing values)
+    """
+    values = array_utils.to_float_array(df[value_col])
+    with np.errstate(invalid="ignore"):
+        flag = (values >= threshold).astype(int)
+
+    return pd.Series(flag, index=df.index)
+
+
+def compute_growth_metrics(df, windows=(7,), threshold=CASES_THRESHOLD,
+                           value_col="cases", group_cols=["fips", "county"], sort_col="date"):
+    """
+    Returns a DataFrame aligned with df with these columns:
+
+    days_since_threshold: days observed since value_col first reached threshold
+                        (1 = first day). NaN before that.
+    doubling_time_{window}: days for value_col to double,
+                        given the growth over the past `window` days.
+    growth_rate_{window}: average daily growth rate over the past `window` days.
+
+    Doubling time and growth rate are only calculated once the threshold is reached.
+    Observations are counted separately before / after the threshold is reached,
+    and the look-back never crosses from one to the other.
+    """
+    gt_threshold = above_threshold(df, value_col, threshold).to_numpy()
+    grouped_df = df[group_cols + [sort_col]].assign(gt_threshold = gt_threshold)
+
+    all_group_cols = group_cols + ["gt_threshold"]
+    order, group_ids = array_utils.sort_and_group(
+        grouped_df, all_group_cols + [sort_col], all_group_cols)
+
+    values = array_utils.to_float_array(df[value_col])[order]
+    is_above = gt_threshold[order] == 1
+    days_obs = (array_utils.grouped_cumcount(group_ids) + 1).astype("float64")
+
+    metrics = {
+        "days_since_threshold": np.where(is_above, days_obs, np.nan)
+    }
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for window in windows:
+            shift_amt = window - 1
+
+            values_in_past = array_utils.grouped_shift(values, group_ids, shift_amt)
+            days_in_past = array_utils.grouped_shift(days_obs, group_ids, shift_amt)
+
+            days_elapsed = days_obs - days_in_past
+            ratio = values / values_in_past
+
+            doubling_time = (days_elapsed * np.log(2)) / np.log(ratio)
+            growth_rate = np.power(ratio, 1 / days_elapsed) - 1
+
+            metrics[f"doubling_time_{window}"] = np.where(is_above, doubling_time, np.nan)
+            metrics[f"growth_rate_{window}"] = np.where(is_above, growth_rate, np.nan)
+
+    metrics = {key: array_utils.unsort(value, order) for key, value in metrics.items()}
+
+    return pd.DataFrame(metrics, index=df.index)
+
+
+def add_growth_metrics(df, windows=(7,), threshold=CASES_THRESHOLD, **kwargs):
+    """
+    Same as compute_growth_metrics, but returns df with the metric columns attached.
+    """
+    metrics = compute_growth_metrics(df, windows, threshold, **kwargs)
+
+    return pd.concat([df, metrics], axis=1)
@@ -2,10 +2,10 @@
 Functions to create charts.
 """
 import altair as alt
-import altair_saver
-import os
 import pandas as pd
 
+from processing_utils import chart_render
+from processing_utils import chart_templates
 from processing_utils import default_parameters
 from processing_utils import utils
 
@@ -13,11 +13,15 @@ from IPython.display import display, SVG
 
 alt.renderers.enable('altair_saver', fmts=['svg'])
 
-def show_svg(image_name):
-    image_path = f"../notebooks/{image_name}.svg"
-    altair_saver.save(image_name, image_path)
-    display(SVG(filename = image_path))
-    os.remove(image_path)
+# Rendered in memory, nothing is written to disk
+def show_svg(chart):
+    display(SVG(data = chart_render.to_svg(chart)))
+
+
+# Render all the charts at once, then display them in order
+def show_svgs(charts):
+    for svg in chart_render.to_svgs(charts):
+        display(SVG(data = svg))
 
     
 #---------------------------------------------------------------#
@@ -58,10 +62,48 @@ two_weeks_ago = default_parameters.two_weeks_ago
 # If chart_width needs to be adjusted because of the legend
 scaling_factor = 0.85
 
+#---------------------------------------------------------------#
+# Chart data
+#---------------------------------------------------------------#
+# Every row of a chart's data is inlined in its spec.
+# Give charts only the columns they encode, and let subsets of the
+# same rows be filters on one dataset. Altair puts identical datasets
+# in the spec once (top-level "datasets"), however many layers use them.
+def chart_data(df, columns):
+    return df[[c for c in columns if c in df.columns]]
+
+
+# Keep dates from start_date on, as a filter in the spec instead of a 2nd copy of the rows
+def filter_since(chart, start_date, date_col="date2"):
+    return chart.transform_filter(
+        alt.FieldGTEPredicate(
+            field=date_col,
+            gte=alt.DateTime(year=start_date.year, month=start_date.month, date=start_date.day)
+        )
+    )
+
+
+# Horizontal rule for a reference value (like a tier cutoff) that's the same on every row.
+# 1 datum instead of a line through every date.
+def reference_values(df, col):
+    return pd.DataFrame({col: df[col].dropna().unique()})
+
+
+def reference_rule(values, col):
+    return (alt.Chart(values)
+            .mark_rule(strokeDash=[2,3], strokeWidth=2, clip=True, tooltip=True)
+            .encode(y=alt.Y(f"{col}:Q"))
+    )
+
+
 #---------------------------------------------------------------#
 # Case Data (County, State, MSA, City of LA)
 #---------------------------------------------------------------#
-def setup_cases_deaths_chart(df, geog, name):
+def cases_deaths_values(df, geog, name):
+    """
+    What changes from one geography's cases and deaths charts to the next:
+    the data, tier cutoffs, title and y-axis max.
+    """
     # Define chart titles
     if geog == "county":
         chart_title = f"{name} County"
@@ -77,12 +119,26 @@ def setup_cases_deaths_chart(df, geog, name):
     # Can't just set min, must set min/max    
     # Alternatively, can drop the values that fall below 0 or set to 0?
     df = df[(df.cases_avg7 > 0) & (df.deaths_avg7 > 0)]
-    cases_max = df.cases_avg7.max()
-    deaths_max = df.deaths_avg7.max()
     
+    return {
+        "data": chart_data(df, ["county", "date2", "cases_avg7", "deaths_avg7"]),
+        "tier1": reference_values(df, "tier1_case_cutoff"),
+        "tier2": reference_values(df, "tier2_case_cutoff"),
+        "tier3": reference_values(df, "tier3_case_cutoff"),
+        "chart_title": chart_title,
+        "cases_max": df.cases_avg7.max(),
+        "deaths_max": df.deaths_avg7.max(),
+    }
+
+
+def setup_cases_deaths_chart(df, geog, name):
+    return build_cases_deaths_chart(**cases_deaths_values(df, geog, name))
+
+
+def build_cases_deaths_chart(data, tier1, tier2, tier3, chart_title, cases_max, deaths_max):
     # Set up base charts
-    base = (alt.Chart(
-        df.drop(columns = "date"))
+    # Cases and deaths charts share 1 dataset, the shaded 2 weeks are a filter on it
+    base = (alt.Chart(data)
         .mark_line()
         .encode(
             x=alt.X("date2", 
@@ -90,18 +146,9 @@ def setup_cases_deaths_chart(df, geog, name):
         )
     )
     
-    base_2weeks = (
-        alt.Chart(df[df.date >= two_weeks_ago].drop(columns = "date"))
-        .mark_line()
-        .encode(
-            x=alt.X("date2", 
-                    title="date", axis=alt.Axis(format=fulldate_format))
-        )
-    )
-    
+    base_2weeks = filter_since(base, two_weeks_ago)
     
-    tier_base = (base.mark_line(strokeDash=[2,3], clip=True, tooltip=True))
-        
+
     # Make cases charts    
     cases_line = (
         base
@@ -126,23 +173,20 @@ def setup_cases_deaths_chart(df, geog, name):
     )
     
     tier1_hline = (
-        tier_base
-        .encode(y=alt.Y("tier1_case_cutoff:Q"),
-               color=alt.value(orange),
+        reference_rule(tier1, "tier1_case_cutoff")
+        .encode(color=alt.value(orange),
                tooltip=alt.Tooltip("tier1_case_cutoff", format=',.2f'))
     )
 
     tier2_hline = (
-        tier_base
-        .encode(y=alt.Y("tier2_case_cutoff:Q"),
-               color=alt.value(maroon),
+        reference_rule(tier2, "tier2_case_cutoff")
+        .encode(color=alt.value(maroon),
                tooltip=alt.Tooltip("tier2_case_cutoff", format=',.2f'))
     )
     
     tier3_hline = (
-        tier_base
-        .encode(y=alt.Y("tier3_case_cutoff:Q"),
-               color=alt.value(purple), 
+        reference_rule(tier3, "tier3_case_cutoff")
+        .encode(color=alt.value(purple),
                tooltip=alt.Tooltip("tier3_case_cutoff", format=',.2f'))
     )
 
@@ -198,15 +242,163 @@ def configure_chart(chart):
     
     return chart
 
-def make_cases_deaths_chart(df, geog, name):  
-    cases_chart, deaths_chart = setup_cases_deaths_chart(df, geog, name)
+def build_combined_cases_deaths_chart(**values):
+    cases_chart, deaths_chart = build_cases_deaths_chart(**values)
     
     # Cases and deaths chart to display side-by-side
     combined_chart = alt.hconcat(cases_chart, deaths_chart)
     
-    combined_chart = configure_chart(combined_chart)
+    return configure_chart(combined_chart)
+
+
+def make_cases_deaths_chart(df, geog, name):  
+    # Built and validated once, each geography after that fills in its values
+    spec = chart_templates.spec("cases_deaths", build_combined_cases_deaths_chart,
+                                **cases_deaths_values(df, geog, name))
         
-    show_svg(combined_chart)
+    show_svg(spec)
+
+
+#---------------------------------------------------------------#
+# Many geographies in 1 chart
+#---------------------------------------------------------------#
+# Charts for N geographies used to be N charts, each with its own copy of the data.
+# Here the long frame (all geographies) goes into the spec once, and it's either
+# faceted into small multiples (a row of panels per geography), or
+# shown 1 geography at a time, picked from a dropdown (interactive, needs the HTML renderer).
+def multi_geography_chart(panels, geog_col, geographies, mode="facet"):
+    """
+    panels: list of layered charts, each with the long frame as its data
+            (like setup_cases_deaths_panels), shown side by side.
+    geog_col: str, column identifying the geography.
+    geographies: list, in the order to show them. Others in the data are left out.
+    mode: str, "facet" or "select".
+    """
+    if mode == "facet":
+        in_list = alt.FieldOneOfPredicate(field=geog_col, oneOf=list(geographies))
+        chart = alt.hconcat(*[facet_panel(panel, geog_col, geographies, in_list) 
+                              for panel in panels])
+    elif mode == "select":
+        selector = alt.selection_single(
+            fields=[geog_col], init={geog_col: geographies[0]},
+            bind=alt.binding_select(options=list(geographies), name=f"{geog_col} "),
+        )
+        chart = alt.hconcat(*[
+            panel.transform_filter(selector) for panel in panels
+        ])
+        chart = chart.add_selection(selector)
+    else:
+        raise ValueError(f"mode must be facet or select, not {mode}")
+    
+    return configure_chart(chart)
+
+
+def show_multi_geography_chart(chart, mode="facet"):
+    """
+    Display a multi_geography_chart: an SVG for "facet", the interactive chart for "select".
+    Its long frame has many geographies' rows (but only the columns we plot),
+    so the row limit is lifted while it's converted, for this chart only.
+    """
+    with alt.data_transformers.disable_max_rows():
+        if mode == "facet":
+            show_svg(chart)
+        else:
+            display(chart)
+
+
+def facet_panel(panel, geog_col, geographies, in_list):
+    # A title inside a facet isn't shown, put it on the facet
+    title = panel.title
+    panel = panel.copy()
+    panel.title = alt.Undefined
+    
+    return (panel.transform_filter(in_list)
+            .facet(row=alt.Row(f"{geog_col}:N", sort=list(geographies), title=None))
+            .resolve_scale(y="independent")
+            .properties(title=title)
+    )
+
+
+tier_cols = ["tier1_case_cutoff", "tier2_case_cutoff", "tier3_case_cutoff"]
+
+def setup_cases_deaths_panels(df, geog_col):
+    """
+    Cases and deaths panels for every geography in df (long, like clean_jhu),
+    for multi_geography_chart.
+    """
+    df = df[(df.cases_avg7 > 0) & (df.deaths_avg7 > 0)]
+    
+    data = chart_data(df, [geog_col, "date2", "cases_avg7", "deaths_avg7"])
+    # Tier cutoffs are the same on every row, keep 1 row per geography
+    tiers = df.groupby(geog_col, observed=True)[tier_cols].max().reset_index()
+    
+    base = (alt.Chart()
+            .encode(
+                x=alt.X("date2:T", 
+                        title="date", axis=alt.Axis(format=fulldate_format))
+            )
+    )
+    base_2weeks = filter_since(base, two_weeks_ago)
+    
+    def line_and_shade(plot_col, color):
+        line = (base
+                .mark_line(tooltip=True)
+                .encode(
+                    y=alt.Y(f"{plot_col}:Q", title="7-day avg"),
+                    color=alt.value(color),
+                    tooltip=[geog_col,
+                        alt.Tooltip('date2:T', format=fulldate_format, title="date"),
+                        alt.Tooltip(f'{plot_col}:Q', format=',.2f')]
+                )
+        )
+        shaded = (base_2weeks
+                  .mark_area()
+                  .encode(
+                      y=alt.Y(f"{plot_col}:Q", title="7-day avg"),
+                      color=alt.value(light_gray)
+                  )
+        )
+        return shaded, line
+    
+    # 1 rule per tier and geography. Like the clipped tier lines in setup_cases_deaths_chart,
+    # leave out the ones above the geography's highest 7-day avg.
+    tier_rules = (base
+        .transform_aggregate(cases_max="max(cases_avg7)", 
+                             **{c: f"max({c})" for c in tier_cols}, groupby=[geog_col])
+        .transform_fold(tier_cols, as_=["tier", "cutoff"])
+        .transform_filter(alt.datum.cutoff <= alt.datum.cases_max)
+        .mark_rule(strokeDash=[2,3], strokeWidth=2, tooltip=True)
+        .encode(
+            x=alt.value(0), x2=alt.value(chart_width),
+            y=alt.Y("cutoff:Q"),
+            color=alt.Color("tier:N", legend=None,
+                            scale=alt.Scale(domain=tier_cols, range=[orange, maroon, purple])),
+            tooltip=["tier:N", alt.Tooltip("cutoff:Q", format=',.2f')]
+        )
+    )
+    
+    # Tier cutoffs come from a small table, instead of being inlined on every row
+    cases_panel = (
+        alt.layer(*line_and_shade("cases_avg7", navy), tier_rules, data=data)
+        .transform_lookup(lookup=geog_col, from_=alt.LookupData(tiers, geog_col, tier_cols))
+        .properties(title="New Cases", width=chart_width, height=chart_height)
+    )
+    
+    deaths_panel = (
+        alt.layer(*line_and_shade("deaths_avg7", blue), data=data)
+        .properties(title="New Deaths", width=chart_width, height=chart_height)
+    )
+    
+    return cases_panel, deaths_panel
+
+
+def make_cases_deaths_charts(df, geog_col, geographies, mode="facet"):
+    df = df[df[geog_col].isin(geographies)]
+    
+    chart = multi_geography_chart(setup_cases_deaths_panels(df, geog_col), 
+                                  geog_col, geographies, mode)
+    
+    show_multi_geography_chart(chart, mode)
 
     
 #---------------------------------------------------------------#
@@ -431,10 +623,14 @@ def make_lacounty_hospital_chart(df):
 # COVID Hospitalizations (CA data portal)
 #---------------------------------------------------------------#
 def setup_county_covid_hospital_chart(df, county_name):
+    return build_county_covid_hospital_chart(chart_data(df, ["date2", "type", "num"]), county_name)
+
+
+def build_county_covid_hospital_chart(data, county_name):
     hospitalizations_color = green
     icu_color = navy
     
-    base = base_hospital_chart(df)
+    base = base_hospital_chart(data)
     
     covid_hospitalizations_chart = (
         base
@@ -456,13 +652,16 @@ def setup_county_covid_hospital_chart(df, county_name):
     return covid_hospitalizations_chart
 
 
+def build_configured_county_covid_hospital_chart(data, county_name):
+    return configure_chart(build_county_covid_hospital_chart(data, county_name))
+
+
 def make_county_covid_hospital_chart(df, county_name):
     
-    chart = setup_county_covid_hospital_chart(df, county_name)
-    
-    covid_hospitalizations_chart = configure_chart(chart)
+    spec = chart_templates.spec("county_covid_hospital", build_configured_county_covid_hospital_chart,
+                                data=chart_data(df, ["date2", "type", "num"]), county_name=county_name)
     
-    show_svg(covid_hospitalizations_chart)
+    show_svg(spec)
 
     
 #---------------------------------------------------------------#
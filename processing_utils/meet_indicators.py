@@ -88,24 +88,23 @@ def past_two_weeks(df, group_cols):
     df = df.assign(
         delta_cases_avg7=(
             df.sort_values("date")
-            .groupby(group_cols)["cases_avg7"]
+            .groupby(group_cols, observed=True)["cases_avg7"]
             .diff(periods=1)
         ),
         delta_deaths_avg7=(
             df.sort_values("date")
-            .groupby(group_cols)["deaths_avg7"]
+            .groupby(group_cols, observed=True)["deaths_avg7"]
             .diff(periods=1)
         )
     )
 
+    # Missing deltas (first day) compare as False, so they count as 0
     df = df.assign(
-        days_fewer_cases = df.apply(lambda row: 1 if row.delta_cases_avg7 < 0 
-                                    else 0, axis=1),
-        days_fewer_deaths = df.apply(lambda row: 1 if row.delta_deaths_avg7 < 0 
-                                     else 0, axis=1),
+        days_fewer_cases = (df.delta_cases_avg7 < 0).astype(int),
+        days_fewer_deaths = (df.delta_deaths_avg7 < 0).astype(int),
     )
 
-    two_week_totals = (df.groupby(group_cols)
+    two_week_totals = (df.groupby(group_cols, observed=True)
                         .agg({"days_fewer_cases": "sum", 
                             "days_fewer_deaths": "sum"})
                         .reset_index()
@@ -128,6 +127,11 @@ def meet_daily_testing(yesterday_date, city_or_county, lower_bound, upper_bound)
     """
     yesterday_date = three_days_ago
 
+    indicator = daily_testing_indicator(df, yesterday_date, city_or_county)
+    return indicator
+
+
+def daily_testing_indicator(df, yesterday_date, city_or_county):
     if city_or_county == "county":
         extract_col = "County_Performed"
         
@@ -152,6 +156,11 @@ def meet_positive_share(yesterday_date, city_or_county, lower_bound, upper_bound
     if city_or_county == "city":
         df = utils.prep_la_positive_test(start_date, "city")
     
+    indicator = positive_share_indicator(df)
+    return indicator
+
+
+def positive_share_indicator(df):
     extract_col = "pct_positive"
     try:
         indicator = df[df.week == df.week.max()].iloc[0][extract_col].round(2)
@@ -171,6 +180,11 @@ def meet_positive_share_for_two_weeks(yesterday_date, city_or_county):
     if city_or_county == "city":
         df = utils.prep_la_positive_test(start_date, "city")
     
+    indicator = positive_share_two_weeks_indicator(df)
+    return indicator
+
+
+def positive_share_two_weeks_indicator(df):
     df = df.assign(
         week = df.week.astype(int),
         group = 1,
@@ -224,8 +238,13 @@ Sub-functions for hospitalization data.
 """
 def meet_hospitalization(county_state_name, yesterday_date):
     df = utils.prep_hospital_surge(county_state_name, start_date)
+    df = hospitalization_change(df, yesterday_date)
     
-     # Calculate change from prior day
+    return df
+
+
+def hospitalization_change(df, yesterday_date):
+    # Calculate change from prior day
     df = df.assign(
         change_hospitalized = df.sort_values("date")["hospitalized_covid"].diff(periods=1),
         change_icu = df.sort_values("date")["icu_covid"].diff(periods=1),
@@ -266,4 +285,146 @@ def meet_hospitalization(county_state_name, yesterday_date):
     )
     
     df = df[df.date == yesterday_date]
-    return df 
\ No newline at end of file
+    return df 
+
+#---------------------------------------------------------------#
+# Indicator snapshot (all indicators, many geographies, one pass)
+#---------------------------------------------------------------#
+INDICATOR_NAMES = [
+    "Cases", "Deaths", 
+    "Daily Testing", "Positive Tests", "Positive Tests (WHO)",
+    "COVID Hospitalizations", "COVID ICU Hospitalizations"
+]
+
+def indicator_snapshot(counties=None, states=None, msas=None, include_lacity=False,
+                       testing_county=default_parameters.county_state_name,
+                       start_date=start_date, yesterday_date=yesterday_date):
+    """
+    Compute the summary indicators for many geographies at once.
+    Each dataset is prepped once and shared across geographies, 
+    instead of meet_case + meet_death each re-prepping the same county.
+    
+    counties / states / msas: lists of names, same formats as prep_county / prep_state / prep_msa.
+    include_lacity: bool, add a City of LA row for cases / deaths.
+    testing_county: str, the county our testing data covers (LA County).
+                    Testing and positivity indicators are only filled in for it.
+    
+    Returns a tidy df: geog, name, indicator, value.
+    Use summary_table() to get indicators x geographies for display.
+    """
+    counties = counties or []
+    states = states or []
+    msas = msas or []
+    
+    case_death = []
+    
+    # Cases and deaths: one batch prep per geography level
+    if counties:
+        case_death.append(case_death_snapshot("county", 
+            utils.prep_counties(counties, start_date, as_dict=True)))
+    if states:
+        case_death.append(case_death_snapshot("state", 
+            utils.prep_states(states, start_date, as_dict=True)))
+    if msas:
+        case_death.append(case_death_snapshot("msa", 
+            utils.prep_msas(msas, start_date, as_dict=True)))
+    if include_lacity:
+        case_death.append(case_death_snapshot("lacity", 
+            {"City of LA": utils.prep_lacity_cases(start_date)}))
+
+    snapshots = [df.melt(id_vars=["geog", "name"], var_name="indicator") 
+                 for df in case_death]
+    
+    # Testing and positivity: LA County only, prep testing data once
+    if testing_county in counties:
+        tests_df = utils.prep_testing(start_date)
+        weekly_df = utils.aggregate_to_week(tests_df, start_date, today_date)
+        
+        testing = {
+            "Daily Testing": daily_testing_indicator(tests_df, three_days_ago, "county"),
+            "Positive Tests": positive_share_indicator(weekly_df),
+            "Positive Tests (WHO)": positive_share_two_weeks_indicator(weekly_df),
+        }
+        snapshots.append(pd.DataFrame({
+            "geog": "county", "name": testing_county,
+            "indicator": list(testing.keys()), "value": list(testing.values()),
+        }))
+    
+    # Hospitalizations: CA counties, prepped in one batch
+    ca_counties = [c for c in counties if is_ca_county(c)]
+    hospital_dict = (utils.prep_hospital_surges(ca_counties, start_date, as_dict=True)
+                     if ca_counties else {})
+    for county_state_name, df in hospital_dict.items():
+        df = hospitalization_change(df, yesterday_date)
+        
+        hospitalization = {
+            "COVID Hospitalizations": first_rounded_value(df, "avg_pct_change_hospitalized"),
+            "COVID ICU Hospitalizations": first_rounded_value(df, "avg_pct_change_icu"),
+        }
+        snapshots.append(pd.DataFrame({
+            "geog": "county", "name": county_state_name,
+            "indicator": list(hospitalization.keys()), "value": list(hospitalization.values()),
+        }))
+    
+    if not snapshots:
+        return pd.DataFrame(columns=["geog", "name", "indicator", "value"])
+    
+    df = (pd.concat(snapshots, ignore_index=True)
+          .assign(value = lambda x: pd.to_numeric(x.value, errors="coerce"))
+          .reset_index(drop=True)
+         )
+    
+    return df
+
+
+def case_death_snapshot(geog, prepped_dict):
+    """
+    prepped_dict: dict of {name: prepped df}, from utils.prep_counties(as_dict=True) etc.
+    Returns days_fewer_cases and days_fewer_deaths for each name, 
+    all geographies in one grouped past_two_weeks.
+    """
+    df = pd.concat([df.assign(name = name) for name, df in prepped_dict.items()], 
+                   ignore_index=True)
+    
+    df = df[(df.date < today_date) & (df.date >= two_weeks_ago)]
+    df = past_two_weeks(df, ["name"])
+    
+    # Keep geographies that had no data in the past 2 weeks (as NaN)
+    df = (pd.DataFrame({"name": list(prepped_dict.keys())})
+          .merge(df, on = "name", how = "left")
+          .assign(geog = geog)
+          .rename(columns = {"days_fewer_cases": "Cases", 
+                             "days_fewer_deaths": "Deaths"})
+          [["geog", "name", "Cases", "Deaths"]]
+         )
+    
+    return df
+
+
+def is_ca_county(county_state_name):
+    if "," not in county_state_name:
+        return False
+    state_name = county_state_name.split(",")[1].strip()
+    return state_name in ["CA", "California"]
+
+
+def first_rounded_value(df, extract_col):
+    try:
+        indicator = df.iloc[0][extract_col].round(2)
+        return indicator
+    except IndexError:
+        return np.nan
+
+
+def summary_table(snapshot):
+    """
+    Reshape indicator_snapshot output to indicators (rows) x geographies (columns),
+    in the order used in the summary tables.
+    """
+    df = (snapshot.pivot_table(index = "indicator", columns = "name", 
+                               values = "value", aggfunc = "first", dropna = False)
+          .reindex(index = INDICATOR_NAMES, columns = snapshot.name.unique())
+         )
+    df.columns.name = None
+    
+    return df
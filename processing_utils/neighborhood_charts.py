@@ -5,6 +5,7 @@ and feed into interactive charts
 import altair as alt
 import pandas as pd
 
+from processing_utils import chart_templates
 from processing_utils import default_parameters
 from processing_utils import make_charts
 from processing_utils import neighborhood_utils
@@ -107,28 +108,51 @@ def prep_data(start_date):
 
 
 
+plot_cols = ["cases_avg7", "cases_p25", "cases_p75", "new_cases_avg7",
+             "cases_per100k_avg7", "ncases_p25", "ncases_p75"]
+
+# chart_type: columns it plots, and its title
+chart_types = {
+    "cases": {"plot_col": "cases_avg7", "p25_col": "cases_p25", "p75_col": "cases_p75",
+              "title": "Cases"},
+    "normalized_cases": {"plot_col": "cases_per100k_avg7", "p25_col": "ncases_p25", 
+                         "p75_col": "ncases_p75", "title": "Cases per 100k"},
+    "new_cases": {"plot_col": "new_cases_avg7", "p25_col": "", "p75_col": "",
+                  "title": "New Cases"},
+}
+
 def setup_chart(df, neighborhood, chart_type):
-    if chart_type == "cases":
-        plot_col = "cases_avg7"
-        p25_col = "cases_p25"
-        p75_col = "cases_p75"
-        chart_title = f"{neighborhood}: Cases"
+    """
+    neighborhood: str, or None for a panel of every neighborhood in df
+            (see make_neighborhood_charts)
+    """
+    return build_chart(chart_data(df, neighborhood, chart_type), neighborhood, chart_type)
+
+
+def chart_data(df, neighborhood, chart_type):
+    """
+    Only the plotted columns, and the shaded 2 weeks are a filter on the same rows.
+    Panels all get the same columns, so their data is in the spec once.
+    """
+    if neighborhood is None:
+        return make_charts.chart_data(df, ["aggregate_region", "date2"] + plot_cols)
     
-    if chart_type == "new_cases":
-        plot_col = "new_cases_avg7"
-        p25_col = ""
-        p75_col = ""
-        chart_title = f"{neighborhood}: New Cases"
+    cols = chart_types[chart_type]
     
-    if chart_type == "normalized_cases":
-        plot_col = "cases_per100k_avg7"
-        chart_title = f"{neighborhood}: Cases per 100k"
-        p25_col = "ncases_p25"
-        p75_col = "ncases_p75"
-        
+    return make_charts.chart_data(df, ["date2", cols["plot_col"], cols["p25_col"], cols["p75_col"]])
+
+
+def build_chart(data, neighborhood, chart_type):
+    plot_col = chart_types[chart_type]["plot_col"]
+    p25_col = chart_types[chart_type]["p25_col"]
+    p75_col = chart_types[chart_type]["p75_col"]
+    chart_title = chart_types[chart_type]["title"]
+    
+    if neighborhood is not None:
+        chart_title = f"{neighborhood}: {chart_title}"
     
     base = (
-        alt.Chart(df.drop(columns = "date"))
+        alt.Chart()
         .encode(
             x=alt.X("date2:T", #timeUnit = time_unit,
                     title="date", axis=alt.Axis(format=fulldate_format)
@@ -136,14 +160,7 @@ def setup_chart(df, neighborhood, chart_type):
         )
     )
     
-    base_2weeks = (
-        alt.Chart(df[df.date >= two_weeks_ago].drop(columns = "date"))
-        .encode(
-            x=alt.X("date2:T", #timeUnit = time_unit,
-                    title="date", axis=alt.Axis(format=fulldate_format)
-                   )
-        )
-    )
+    base_2weeks = make_charts.filter_since(base, two_weeks_ago)
     
     # Make cases charts
     cases_line = (base
@@ -185,26 +202,23 @@ def setup_chart(df, neighborhood, chart_type):
     )
     
     if (chart_type == "cases") or (chart_type == "normalized_cases"):
-        chart =  ((cases_shaded + cases_line + ptile25_line + ptile75_line)
+        chart =  (alt.layer(cases_shaded, cases_line, ptile25_line, ptile75_line, data=data)
                   .properties(title=chart_title, height=chart_height, width=chart_width)
                  )
                 
     
     if chart_type == "new_cases":
-        chart = ((cases_shaded + cases_line)
+        chart = (alt.layer(cases_shaded, cases_line, data=data)
                 .properties(title=chart_title, height=chart_height, width=chart_width)
                 )
     
     return chart
     
 
-def make_chart(df, neighborhood):
-    
-    subset_df = df[df.aggregate_region == neighborhood]
-    
-    cases_chart = setup_chart(subset_df, neighborhood, "cases")
-    ncases_chart = setup_chart(subset_df, neighborhood, "normalized_cases")
-    new_cases_chart = setup_chart(subset_df, neighborhood, "new_cases")
+def build_combined_chart(neighborhood, cases, normalized_cases, new_cases):
+    cases_chart = build_chart(cases, neighborhood, "cases")
+    ncases_chart = build_chart(normalized_cases, neighborhood, "normalized_cases")
+    new_cases_chart = build_chart(new_cases, neighborhood, "new_cases")
     
     combined_chart = (
         alt.hconcat(cases_chart, ncases_chart, new_cases_chart)
@@ -215,13 +229,61 @@ def make_chart(df, neighborhood):
         .configure_view(strokeOpacity=stroke_opacity)
     )
     
+    return combined_chart
+
+
+def chart_values(subset_df, neighborhood):
+    return {
+        "neighborhood": neighborhood,
+        **{chart_type: chart_data(subset_df, neighborhood, chart_type) 
+           for chart_type in chart_types},
+    }
+
+
+def describe(subset_df, neighborhood):
     group_name = subset_df.group_name.iloc[0]
     
     display(Markdown(f"#### {neighborhood} ({group_name})"))
     summary_sentence(subset_df, neighborhood)
 
+
+def make_chart(df, neighborhood):
+    subset_df = df[df.aggregate_region == neighborhood]
+    
+    combined_chart = build_combined_chart(**chart_values(subset_df, neighborhood))
+    
+    describe(subset_df, neighborhood)
+
     #make_charts.show_svg(combined_chart)
     return combined_chart
+
+
+def make_chart_spec(df, neighborhood):
+    """
+    Same as make_chart, but returns the Vega-Lite spec (dict), for make_charts.show_svg.
+    Built and validated once, each neighborhood after that fills in its data and titles.
+    """
+    subset_df = df[df.aggregate_region == neighborhood]
+    
+    spec = chart_templates.spec("neighborhood", build_combined_chart, 
+                                **chart_values(subset_df, neighborhood))
+    
+    describe(subset_df, neighborhood)
+
+    return spec
+
+
+# Charts for many neighborhoods at once, with the data in the spec once.
+# mode: "facet" (a row of charts per neighborhood) or "select" (pick 1 from a dropdown)
+def make_neighborhood_charts(df, neighborhoods, mode="facet"):
+    df = df[df.aggregate_region.isin(neighborhoods)]
+    
+    panels = [setup_chart(df, None, chart_type) 
+              for chart_type in ["cases", "normalized_cases", "new_cases"]]
+    
+    chart = make_charts.multi_geography_chart(panels, "aggregate_region", neighborhoods, mode)
+    
+    make_charts.show_multi_geography_chart(chart, mode)
     
         
         
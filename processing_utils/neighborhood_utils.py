@@ -6,6 +6,8 @@ import numpy as np
 import geopandas as gpd
 import pandas as pd
 from processing_utils import default_parameters
+from processing_utils import feature_store
+from processing_utils import schemas
 
 from datetime import date, timedelta
 
@@ -20,8 +22,19 @@ CROSSWALK_URL = f"{S3_FILE_PATH_SOURCE}la_neighborhoods_population_crosswalk.par
 NEIGHBORHOOD_APPENDED_URL = f"{S3_FILE_PATH_SOURCE}la-county-neighborhood-testing-appended.parquet"
 
 def clean_data():
-    df = pd.read_parquet(NEIGHBORHOOD_URL)
-    crosswalk = pd.read_parquet(CROSSWALK_URL)
+    df = feature_store.read("neighborhood_clean_data")
+    
+    if df is None:
+        df = build_clean_data()
+    
+    return df
+
+
+def build_clean_data():
+    df = schemas.load("la-county-neighborhood-time-series", 
+                      columns=["Region", "date", "date2", "cases", "deaths"])
+    crosswalk = schemas.load("la_neighborhoods_population_crosswalk", 
+                             columns=["Region", "aggregate_region", "population"])
     
     # Get rid of duplicates
     # We keep the incorporated and unincorporated labels because     
@@ -30,10 +43,9 @@ def clean_data():
           .assign(
               # Had to convert date to string to write to parquet, but we want it as datetime/object
               date = pd.to_datetime(df.date).dt.date,
-              cases = df.groupby(["Region", "date", "date2"])["cases"].transform("max"),
-              deaths = df.groupby(["Region", "date", "date2"])["deaths"].transform("max"),
+              cases = df.groupby(["Region", "date", "date2"], observed=True)["cases"].transform("max"),
+              deaths = df.groupby(["Region", "date", "date2"], observed=True)["deaths"].transform("max"),
           ).drop_duplicates(subset = ["Region", "date", "date2", "cases", "deaths"])
-          .drop(columns = ["LCITY", "COMMUNITY", "LABEL"])
     )
 
     
@@ -216,6 +228,15 @@ def derive_columns(df, sort_cols, group_cols):
 
 
 def clean_testing_data():
+    df = feature_store.read("neighborhood_clean_testing_data")
+    
+    if df is None:
+        df = build_clean_testing_data()
+    
+    return df
+
+
+def build_clean_testing_data():
     df = pd.read_parquet(NEIGHBORHOOD_APPENDED_URL)
 
     keep_cols = ["neighborhood", "persons_tested_final", 
@@ -0,0 +1,207 @@
+"""
+Run the report notebooks concurrently, and publish each one as soon as it's done.
+
+Each notebook runs with papermill in its own process (at most max_concurrent
+at once). As each one finishes, this process converts it to HTML with nbconvert
+and publishes it, while the rest are still running. Publishing happens one
+notebook at a time, since every upload commits to the same branch.
+With batch=True, the converted notebooks are published together
+once they've all finished instead (1 commit for the whole run).
+
+Every notebook gets a result: which step failed (if any), the error,
+and how long each step took.
+
+publish_reports is what the report_county_trends scripts call:
+build the feature store, run the notebooks, and upload each HTML to GitHub.
+"""
+import os
+import subprocess
+import time
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from processing_utils import feature_store
+from processing_utils import github_utils as gh
+
+# Each notebook holds its own kernel and data in memory
+MAX_CONCURRENT = int(os.environ.get("REPORT_MAX_CONCURRENT", 2))
+
+
+def execute_notebook(notebook, output_path, cwd):
+    """
+    Runs in the worker process. Returns how long it took (seconds).
+    """
+    # Only the report scripts need papermill, not everything importing processing_utils
+    import papermill as pm
+
+    start = time.perf_counter()
+    pm.execute_notebook(notebook, output_path, cwd=cwd, log_output=True)
+
+    return time.perf_counter() - start
+
+
+def convert_to_html(output_path):
+    """
+    nbconvert the executed notebook, without code cells or prompts.
+    Returns the name of the HTML file.
+    """
+    subprocess.run([
+        "jupyter",
+        "nbconvert",
+        "--to",
+        "html",
+        "--no-input",
+        "--no-prompt",
+        output_path,
+    ], check=True)
+
+    name = output_path.replace(".ipynb", "").replace("./", "")
+
+    return f"{name}.html"
+
+
+def run_reports(notebooks, publish, notebook_dir="/app/notebooks",
+                max_concurrent=MAX_CONCURRENT, batch=False):
+    """
+    notebooks: dict of {notebook file in notebook_dir: executed notebook output path}
+    publish: function(html_file_name, name), called once per notebook that
+            executed and converted, in the order they finish.
+            With batch=True, function({html_file_name: name}), called once
+            with every notebook that executed and converted.
+
+    Returns dict of {notebook: result}, where result has
+    status (success or failed), step (execute, convert, publish) and error
+    if it failed, and seconds spent on each step.
+    """
+    results = {}
+
+    with ProcessPoolExecutor(max_workers=max_concurrent) as pool:
+        futures = {}
+        for key, output_path in notebooks.items():
+            print(f"Running notebook {key}")
+            future = pool.submit(execute_notebook, f"{notebook_dir}/{key}",
+                                 output_path, notebook_dir)
+            futures[future] = key
+
+        for future in as_completed(futures):
+            key = futures[future]
+            results[key] = finish_report(future, notebooks[key],
+                                         None if batch else publish)
+
+    if batch:
+        publish_batch(results, publish)
+
+    print_results(results)
+
+    return results
+
+
+def finish_report(future, output_path, publish):
+    """
+    Convert and publish one executed notebook, recording each step.
+    publish None leaves it converted, at the publish step, for publish_batch.
+    """
+    result = {"status": "failed", "step": "execute", "error": None, "seconds": {}}
+
+    try:
+        result["seconds"]["execute"] = future.result()
+
+        result["step"] = "convert"
+        start = time.perf_counter()
+        html_file_name = convert_to_html(output_path)
+        result["seconds"]["convert"] = time.perf_counter() - start
+
+        result["step"] = "publish"
+        result["html"] = html_file_name
+        if publish is None:
+            return result
+
+        start = time.perf_counter()
+        publish(html_file_name, html_file_name.replace(".html", ""))
+        result["seconds"]["publish"] = time.perf_counter() - start
+    except Exception as e:
+        traceback.print_exc()
+        result["error"] = repr(e)
+        return result
+
+    result["status"] = "success"
+    result["step"] = None
+
+    return result
+
+
+def publish_batch(results, publish):
+    """
+    Publish every converted notebook in 1 call, and record it on each of their results.
+    """
+    converted = [result for result in results.values()
+                 if result["step"] == "publish" and result["error"] is None]
+    if not converted:
+        return
+
+    start = time.perf_counter()
+    try:
+        publish({result["html"]: result["html"].replace(".html", "") for result in converted})
+    except Exception as e:
+        traceback.print_exc()
+        for result in converted:
+            result["error"] = repr(e)
+        return
+
+    for result in converted:
+        result["seconds"]["publish"] = time.perf_counter() - start
+        result["status"] = "success"
+        result["step"] = None
+
+
+def print_results(results):
+    for key, result in results.items():
+        seconds = ", ".join(f"{step} {s:.0f}s" for step, s in result["seconds"].items())
+        if result["status"] == "success":
+            print(f"{key}: success ({seconds})")
+        else:
+            print(f"{key}: failed at {result['step']}: {result['error']} ({seconds})")
+
+
+#---------------------------------------------------------------#
+# Report scripts
+#---------------------------------------------------------------#
+def publish_reports(notebooks, token, repo, branch, publish_path,
+                    committer=gh.DEFAULT_COMMITTER, batch=False, **kwargs):
+    """
+    Run notebooks and upload their HTML to repo / branch under publish_path.
+
+    By default each notebook is uploaded (1 commit) as soon as it's converted,
+    so a report is up without waiting on the slowest notebook.
+    batch=True uploads them all in 1 commit at the end instead (fewer commits,
+    but nothing is up until every notebook is done).
+    kwargs go to run_reports.
+
+    Returns the run_reports results.
+    """
+    def upload(html_files):
+        for html_file_name in html_files:
+            print(f"html name: {publish_path}{html_file_name}")
+
+        gh.upload_files(
+            token,
+            repo, branch,
+            {html_file_name: f"{publish_path}{html_file_name}"
+             for html_file_name in html_files},
+            f"Update {', '.join(html_files.values())}",
+            committer)
+
+        print(f"Successful upload of {', '.join(html_files.values())} to GitHub")
+
+    def publish(html_file_name, name):
+        upload({html_file_name: name})
+
+    # Build the shared tables once (if the ETL hasn't already today), so notebooks only read them.
+    # A table that fails to build isn't fatal, the notebooks build it themselves.
+    try:
+        feature_store.build_all()
+    except Exception as e:
+        print(f"Feature store not fully built: {e!r}")
+
+    return run_reports(notebooks, upload if batch else publish, batch=batch, **kwargs)
@@ -0,0 +1,168 @@
+"""
+Vectorized outlier detection for daily new cases / deaths.
+
+One sort, grouped shifts and boolean masks in NumPy,
+so it runs the same way on a single county or every US county-day.
+
+Rules are pluggable. A rule is a function that takes
+(values, group_ids) -- both in sorted order -- and returns a boolean
+array flagging the outliers. Build them with ratio_rule() or mad_rule().
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from processing_utils import array_utils
+
+# When we get to small numbers of new cases, it's easy for it to oscillate more
+# Only apply outlier rules if the surrounding days are above this
+SMALL_NUMBERS_CUTOFF = 100
+
+# Columns that identify a geography, in the order we sort by
+GEOGRAPHY_COLS = ["county", "state", "fips", "msa"]
+
+# Scale MAD so it's comparable to a standard deviation for normal data
+MAD_SCALE = 1.4826
+
+
+#---------------------------------------------------------------#
+# Rules
+#---------------------------------------------------------------#
+def ratio_rule(threshold=5, small_numbers_cutoff=SMALL_NUMBERS_CUTOFF):
+    """
+    If the new cases is more than `threshold`x the previous day's
+    AND the next day's new cases, it's probably an outlier.
+    Found 1 case of outlier in LA on 5/27/21, where it showed over 4,000 new cases
+    in the raw data, but surrounding days are in the 100-200's.
+    """
+    def rule(values, group_ids):
+        previous_day = array_utils.grouped_shift(values, group_ids, 1)
+        post_day = array_utils.grouped_shift(values, group_ids, -1)
+
+        # Comparisons with NaN are False, so a missing neighbor is never an outlier
+        with np.errstate(invalid="ignore"):
+            return ((values >= previous_day * threshold) &
+                    (values >= post_day * threshold) &
+                    (previous_day > small_numbers_cutoff) &
+                    (post_day > small_numbers_cutoff)
+                   )
+
+    return rule
+
+
+def mad_rule(window=7, threshold=3.5, small_numbers_cutoff=SMALL_NUMBERS_CUTOFF):
+    """
+    Flag a day if it's more than `threshold` scaled MADs
+    (median absolute deviations) away from the rolling median of the
+    centered `window` days around it, within the same geography.
+    Rolling median is skipped where it's at or below small_numbers_cutoff.
+    """
+    half_window = window // 2
+
+    def rule(values, group_ids):
+        # Stack the neighbors (within group) into a n x window matrix
+        neighbors = np.column_stack([
+            array_utils.grouped_shift(values, group_ids, offset)
+            for offset in range(half_window, -half_window - 1, -1)
+        ])
+
+        with warnings.catch_warnings():
+            # All-NaN windows (missing data) are fine, they just don't get flagged
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            median = np.nanmedian(neighbors, axis=1)
+            mad = np.nanmedian(np.abs(neighbors - median[:, None]), axis=1)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return ((np.abs(values - median) > threshold * MAD_SCALE * mad) &
+                    (mad > 0) &
+                    (median > small_numbers_cutoff)
+                   )
+
+    return rule
+
+
+#---------------------------------------------------------------#
+# Apply rules
+#---------------------------------------------------------------#
+def default_group_cols(df):
+    return [c for c in GEOGRAPHY_COLS if c in df.columns]
+
+
+def sorted_values(df, value_col, group_cols, sort_col):
+    order, group_ids = array_utils.sort_and_group(df, group_cols + [sort_col], group_cols)
+    values = array_utils.to_float_array(df[value_col])[order]
+
+    return order, group_ids, values
+
+
+def flag_outliers(df, rules=None, value_col="new_cases", group_cols=None, sort_col="date"):
+    """
+    Returns a boolean Series (aligned with df) that's True
+    if any of the rules flags that row.
+
+    df: pandas.DataFrame, one or many geographies
+    rules: list of rule functions, defaults to [ratio_rule()]
+    value_col: str, column to check
+    group_cols: list, columns that identify a geography.
+                Defaults to whichever of county/state/fips/msa are present.
+    """
+    if rules is None:
+        rules = [ratio_rule()]
+    if group_cols is None:
+        group_cols = default_group_cols(df)
+
+    order, group_ids, values = sorted_values(df, value_col, group_cols, sort_col)
+    flagged = apply_rules(rules, values, group_ids)
+
+    return pd.Series(array_utils.unsort(flagged, order), index=df.index)
+
+
+def apply_rules(rules, values, group_ids):
+    flagged = np.zeros(len(values), dtype=bool)
+    for rule in rules:
+        flagged |= rule(values, group_ids)
+
+    return flagged
+
+
+def has_neighbors(values, group_ids):
+    """
+    True if the previous and next day's values exist within the geography.
+    """
+    return (~np.isnan(array_utils.grouped_shift(values, group_ids, 1)) &
+            ~np.isnan(array_utils.grouped_shift(values, group_ids, -1))
+           )
+
+
+def remove_outliers(df, rules=None, value_col="new_cases", group_cols=None,
+                    sort_col="date", drop_incomplete=True):
+    """
+    Drop the flagged rows and return df sorted by geography and date.
+
+    drop_incomplete: bool. Our original rule only kept rows it could evaluate:
+        rows with any missing value, and the first / last day of each geography
+        (no previous / next day) were dropped along with the outliers.
+        Keep that as the default so results don't change.
+    """
+    if rules is None:
+        rules = [ratio_rule()]
+    if group_cols is None:
+        group_cols = default_group_cols(df)
+    sort_cols = group_cols + [sort_col]
+
+    order, group_ids, values = sorted_values(df, value_col, group_cols, sort_col)
+    keep = ~apply_rules(rules, values, group_ids)
+
+    if drop_incomplete:
+        keep &= has_neighbors(values, group_ids)
+        keep = array_utils.unsort(keep, order) & df.notna().all(axis=1).to_numpy()
+    else:
+        keep = array_utils.unsort(keep, order)
+
+    df = (df[keep]
+          .sort_values(sort_cols)
+          .reset_index(drop=True)
+         )
+
+    return df
@@ -0,0 +1,130 @@
+"""
+Compact dtypes for the parquet artifacts we write to S3.
+
+Applied right before the to_parquet calls in `data/` for artifacts
+we only read internally. The parquets published to GitHub
+(us-county-time-series, global-time-series) keep their schema.
+- repeated strings (county, state, fips, Region...) become categoricals.
+  They're stored dictionary-encoded and read back as categoricals,
+  so filters and groupbys run on integer codes.
+- integer counts get the smallest width that holds them,
+  nullable Int64 stays nullable (Int32, Int16...).
+- calendar dates are stored as date32, instead of strings
+  or tz-aware timestamps at midnight Pacific.
+
+CSVs are written from the frame before this step, so they don't change.
+"""
+import numpy as np
+import pandas as pd
+
+from processing_utils import default_parameters
+
+time_zone = default_parameters.time_zone
+
+# A string column becomes categorical if at most this share of its values are unique
+MAX_UNIQUE_SHARE = 0.5
+
+INTEGER_WIDTHS = ["int8", "int16", "int32", "int64"]
+
+
+def compact_dtypes(df, date_cols=None, categorical_cols=None):
+    """
+    Returns a copy of df with compact dtypes.
+
+    date_cols: list, columns that hold calendar dates (date32 in parquet).
+    categorical_cols: list. Defaults to every string column with repeated values.
+    """
+    df = df.copy()
+    date_cols = list(date_cols or [])
+
+    for col in date_cols:
+        df[col] = to_calendar_date(df[col])
+
+    if categorical_cols is None:
+        categorical_cols = [c for c in df.columns
+                            if c not in date_cols and is_repeated_string(df[c])]
+
+    for col in categorical_cols:
+        df[col] = df[col].astype("category")
+
+    for col in df.columns:
+        if pd.api.types.is_integer_dtype(df[col].dtype):
+            df[col] = downcast_integer(df[col])
+
+    return df
+
+
+def to_calendar_date(series):
+    """
+    Strings, naive timestamps or tz-aware timestamps (midnight Pacific)
+    to datetime.date, which pyarrow writes as date32.
+    """
+    if isinstance(series.dtype, pd.DatetimeTZDtype):
+        series = series.dt.tz_convert(time_zone)
+    elif not pd.api.types.is_datetime64_dtype(series.dtype):
+        series = pd.to_datetime(series)
+
+    dates = series.dt.date
+
+    return dates.where(series.notna(), None)
+
+
+def is_repeated_string(series):
+    if not (pd.api.types.is_object_dtype(series.dtype) or
+            pd.api.types.is_string_dtype(series.dtype)):
+        return False
+
+    values = series.dropna()
+    if len(values) == 0 or not values.map(type).eq(str).all():
+        return False
+
+    return values.nunique() <= MAX_UNIQUE_SHARE * len(values)
+
+
+def downcast_integer(series):
+    """
+    Smallest signed integer width that holds the column's min and max
+    """
+    values = series.dropna()
+    if len(values) == 0:
+        return series
+
+    low, high = values.min(), values.max()
+    is_nullable = isinstance(series.dtype, pd.api.extensions.ExtensionDtype)
+
+    for width in INTEGER_WIDTHS:
+        info = np.iinfo(width)
+        if info.min <= low and high <= info.max:
+            return series.astype(width.capitalize() if is_nullable else width)
+
+    return series
+
+
+def expand_dtypes(df):
+    """
+    Undo compact_dtypes for the ETL scripts that read their own output back
+    and append to it: categoricals back to strings, integers back to Int64.
+    Calendar dates are left as datetime.date.
+    """
+    df = df.copy()
+
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object).where(df[col].notna(), np.nan)
+        elif pd.api.types.is_integer_dtype(df[col].dtype):
+            df[col] = df[col].astype("Int64")
+
+    return df
+
+
+def sort_categories(df):
+    """
+    Categories in sorted order, so sort_values on a categorical
+    matches sorting the strings. A dataset read from several files
+    unifies their dictionaries in the order it finds them.
+    """
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+
+    return df
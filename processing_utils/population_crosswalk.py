@@ -0,0 +1,158 @@
+"""
+MSA / county population crosswalk.
+
+Load `msa_county_pop_crosswalk.csv` once per process,
+keep a copy on local disk so we don't hit GitHub on every run,
+and precompute the lookups our prep_* functions need:
+county fips -> county_pop, state -> state_pop,
+MSA (cbsacode) -> member counties and msa_pop.
+"""
+import os
+import time
+
+import pandas as pd
+
+from processing_utils import default_parameters
+
+CROSSWALK_URL = (
+    "https://raw.githubusercontent.com/CityOfLosAngeles/covid19-indicators/master/data/"
+    "msa_county_pop_crosswalk.csv"
+)
+
+CACHE_DIR = default_parameters.CACHE_DIR
+
+LOCAL_CROSSWALK = os.path.join(CACHE_DIR, "msa_county_pop_crosswalk.parquet")
+
+# Population crosswalk rarely changes; re-download once a week
+MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+
+_crosswalk = None
+_indexes = {}
+
+
+def load_crosswalk():
+    """
+    Returns the full crosswalk, reading it at most once per process.
+    Order of preference: in-memory, local disk cache, GitHub.
+    If GitHub can't be reached, fall back to a stale disk copy.
+    """
+    global _crosswalk
+
+    if _crosswalk is not None:
+        return _crosswalk
+
+    is_fresh = (os.path.exists(LOCAL_CROSSWALK) and
+                (time.time() - os.path.getmtime(LOCAL_CROSSWALK)) < MAX_AGE_SECONDS)
+
+    if is_fresh:
+        df = pd.read_parquet(LOCAL_CROSSWALK)
+    else:
+        try:
+            df = pd.read_csv(CROSSWALK_URL,
+                             dtype={"county_fips": "str", "cbsacode": "str"})
+            save_local_copy(df)
+        except OSError:
+            if not os.path.exists(LOCAL_CROSSWALK):
+                raise
+            df = pd.read_parquet(LOCAL_CROSSWALK)
+
+    _crosswalk = df
+    build_indexes(df)
+
+    return _crosswalk
+
+
+def save_local_copy(df):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    # Write then rename, so a half-written file is never picked up
+    tmp_path = f"{LOCAL_CROSSWALK}.tmp"
+    df.to_parquet(tmp_path)
+    os.replace(tmp_path, LOCAL_CROSSWALK)
+
+
+def build_indexes(df):
+    _indexes["county_pop"] = (df.drop_duplicates(subset="county_fips")
+                              .set_index("county_fips")["county_pop"]
+                             )
+
+    _indexes["state_pop"] = (df.groupby("state")["county_pop"].sum()
+                             .rename("state_pop")
+                            )
+
+    msa = df[df.cbsacode.notna()]
+
+    _indexes["msa_pop"] = (msa.drop_duplicates(subset="cbsacode")
+                           .set_index("cbsacode")["msa_pop"]
+                          )
+
+    _indexes["msa_title"] = (msa.drop_duplicates(subset="cbsacode")
+                             .set_index("cbsacode")["cbsatitle"]
+                            )
+
+    _indexes["msa_counties"] = msa.groupby("cbsacode")["county_fips"].agg(list).to_dict()
+
+
+def county_pop():
+    """
+    pandas.Series, county_pop indexed by 5-digit county fips
+    """
+    load_crosswalk()
+    return _indexes["county_pop"]
+
+
+def state_pop():
+    """
+    pandas.Series, state_pop indexed by state name
+    """
+    load_crosswalk()
+    return _indexes["state_pop"]
+
+
+def msa_pop():
+    """
+    pandas.Series, msa_pop indexed by cbsacode
+    """
+    load_crosswalk()
+    return _indexes["msa_pop"]
+
+
+def msa_counties(cbsacode):
+    """
+    List of county fips that belong to the MSA
+    """
+    load_crosswalk()
+    return _indexes["msa_counties"].get(cbsacode, [])
+
+
+def find_msa_codes(msa_name):
+    """
+    Match msa_name the same way prep_msa always has:
+    exact cbsatitle, cbsatitle contains msa_name, or exact cbsacode.
+    Only scans the ~900 unique titles, not the full county table.
+    """
+    load_crosswalk()
+    titles = _indexes["msa_title"]
+
+    matched = titles[(titles == msa_name) |
+                     (titles.str.contains(msa_name)) |
+                     (titles.index == msa_name)]
+
+    return list(matched.index)
+
+
+def msa_members(msa_name):
+    """
+    Returns the counties in the matched MSA(s),
+    with the same columns prep_msa used to pull out of the crosswalk:
+    cbsacode, cbsatitle, msa_pop, county_fips, msa
+    """
+    codes = find_msa_codes(msa_name)
+
+    rows = [(code, _indexes["msa_title"][code], _indexes["msa_pop"][code], fips)
+            for code in codes for fips in msa_counties(code)]
+
+    df = pd.DataFrame(rows, columns=["cbsacode", "cbsatitle", "msa_pop", "county_fips"])
+    df = df.assign(msa=df.cbsatitle)
+
+    return df
@@ -0,0 +1,136 @@
+"""
+Schema registry for the parquet artifacts we keep in S3.
+
+Each entry lists the artifact's columns and dtypes, as written
+by the scripts in `data/` (see parquet_dtypes: integer columns are stored
+at the smallest width that fits). Readers declare the columns they need,
+and load() only reads those (plus any filters) through the dataset cache,
+instead of reading the whole file and subsetting to keep_cols.
+"""
+from processing_utils import dataset_cache
+from processing_utils import default_parameters
+from processing_utils import us_county_dataset
+
+S3_FILE_PATH = default_parameters.S3_FILE_PATH
+S3_FILE_PATH_SOURCE = default_parameters.S3_FILE_PATH_SOURCE
+
+SCHEMAS = {
+    "us-county-time-series": {
+        "url": us_county_dataset.DATASET_URL,
+        "read_kwargs": {"partitioning": us_county_dataset.PARTITIONING},
+        "columns": {
+            "county": "category",
+            "state": "str",
+            "fips": "category",
+            "date": "date32",
+            "Lat": "float64",
+            "Lon": "float64",
+            "cases": "Int64",
+            "deaths": "Int64",
+            "incident_rate": "float64",
+            "people_tested": "Int64",
+            "state_cases": "Int64",
+            "state_deaths": "Int64",
+            "new_cases": "Int64",
+            "new_deaths": "Int64",
+            "new_state_cases": "Int64",
+            "new_state_deaths": "Int64",
+        },
+    },
+    "county-city-testing": {
+        "url": f"{S3_FILE_PATH}county-city-testing.parquet",
+        "columns": {
+            "date": "datetime64[ns]",
+            "County_Person_Performed": "Int64",
+            "County_Person_Positive": "Int64",
+            "County_Performed": "Int64",
+            "County_Positive": "Int64",
+        },
+    },
+    "ca-hospital-and-surge-capacity": {
+        "url": f"{S3_FILE_PATH}ca-hospital-and-surge-capacity.parquet",
+        "columns": {
+            "date": "date32",
+            "county": "category",
+            "county_fips": "category",
+            "hospitalized_covid": "Int64",
+            "all_hospital_beds": "Int64",
+            "icu_covid": "Int64",
+            "all_icu_beds": "Int64",
+            "surge_available_beds": "Int64",
+        },
+    },
+    "la-county-neighborhood-time-series": {
+        "url": f"{S3_FILE_PATH}la-county-neighborhood-time-series.parquet",
+        "columns": {
+            "Region": "category",
+            "Longitude": "float64",
+            "Latitude": "float64",
+            "date": "date32",
+            "date2": "datetime64[ns]",
+            "cases": "Int64",
+            "deaths": "Int64",
+            "LCITY": "category",
+            "COMMUNITY": "category",
+            "LABEL": "category",
+        },
+    },
+    "la_neighborhoods_population_crosswalk": {
+        "url": f"{S3_FILE_PATH_SOURCE}la_neighborhoods_population_crosswalk.parquet",
+        "columns": {
+            "region_num": "float64",
+            "population": "float64",
+            "aggregate_region": "str",
+            "neighborhood": "str",
+            "Region": "str",
+            "in_two_aggregate_regions": "str",
+        },
+    },
+    "ca_county_pop_crosswalk": {
+        "url": f"{S3_FILE_PATH_SOURCE}ca_county_pop_crosswalk.parquet",
+        "columns": {
+            "county": "str",
+            "county_pop2020": "int64",
+            "county_fips": "str",
+        },
+    },
+}
+
+
+def columns(name):
+    """
+    List of columns in the artifact, in the order they're written
+    """
+    return list(SCHEMAS[name]["columns"])
+
+
+def dtypes(name):
+    """
+    dict of {column: dtype} for the artifact
+    """
+    return dict(SCHEMAS[name]["columns"])
+
+
+def load(name, columns=None, filters=None, normalize=None):
+    """
+    Read an artifact through the dataset cache, with only what the caller needs.
+
+    name: str, key in SCHEMAS
+    columns: list. Defaults to all of them.
+            Columns not in the schema raise a KeyError before anything is read.
+    filters: pyarrow filters (list of tuples), pushed down to read_parquet.
+    normalize: function, applied once to the frame after it's read.
+    """
+    schema = SCHEMAS[name]
+    kwargs = dict(schema.get("read_kwargs", {}))
+
+    if columns is not None:
+        unknown = [c for c in columns if c not in schema["columns"]]
+        if unknown:
+            raise KeyError(f"{unknown} not in {name} schema")
+        kwargs["columns"] = list(columns)
+
+    if filters:
+        kwargs["filters"] = filters
+
+    return dataset_cache.read_parquet(schema["url"], normalize=normalize, **kwargs)
@@ -0,0 +1,224 @@
+"""
+Small task-graph runner for the ETL jobs in `data/`.
+
+Each Task names its update function as "module:function" (so a worker
+process can import it), the artifacts it reads (inputs) and writes (outputs),
+the URLs it downloads (sources), and the tasks that have to finish first (deps).
+
+run() starts every task whose deps are done on a process pool,
+so independent tasks run at the same time, and records how long each one took.
+
+A task is skipped when its inputs and outputs are the same versions
+(ETag / mtime, see artifacts.object_version) as when it last succeeded,
+and none of its deps ran. Tasks with sources always run;
+they check their own downloads (fetch.already_processed).
+"""
+import importlib
+import json
+import time
+import traceback
+
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import fsspec
+
+from processing_utils import artifacts
+from processing_utils import default_parameters
+
+S3_FILE_PATH = default_parameters.S3_FILE_PATH
+
+# Where each task's input / output versions from its last successful run are kept
+STATE_URL = f"{S3_FILE_PATH}_tasks"
+
+Task = namedtuple("Task", ["name", "func", "inputs", "outputs", "deps", "sources"],
+                  defaults=([], [], [], []))
+
+
+#---------------------------------------------------------------#
+# Worker
+#---------------------------------------------------------------#
+def run_task(func):
+    """
+    Runs in the worker process.
+    Returns the duration and which artifacts were written / skipped.
+
+    Some scripts sys.exit() when there's nothing to do (success),
+    or sys.exit("message") on an error, which fails the task.
+    """
+    module_name, func_name = func.split(":")
+    update = getattr(importlib.import_module(module_name), func_name)
+
+    artifacts.reset_report()
+    start = time.perf_counter()
+    try:
+        update()
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise RuntimeError(f"{func} exited: {e.code}") from None
+
+    return {
+        "duration": time.perf_counter() - start,
+        "artifacts": artifacts.report(),
+    }
+
+
+#---------------------------------------------------------------#
+# State
+#---------------------------------------------------------------#
+def state_path(task):
+    return f"{STATE_URL}/{task.name}.json"
+
+
+def versions(paths):
+    return {path: artifacts.object_version(path) for path in paths}
+
+
+def read_state(task):
+    try:
+        with fsspec.open(state_path(task), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_state(task, duration):
+    fs, fs_path = fsspec.core.url_to_fs(state_path(task))
+    fs.makedirs(fs_path.rsplit("/", 1)[0], exist_ok=True)
+
+    state = {
+        "inputs": versions(task.inputs),
+        "outputs": versions(task.outputs),
+        "duration": duration,
+        "finished": time.time(),
+    }
+
+    with fs.open(fs_path, "w") as f:
+        json.dump(state, f)
+
+
+def needs_run(task, results):
+    """
+    Why task has to run, or None if it can be skipped.
+    """
+    if task.sources:
+        return "downloads sources"
+
+    if any(results[dep]["status"] == "ran" for dep in task.deps):
+        return "dependency ran"
+
+    state = read_state(task)
+    if state is None:
+        return "no previous run"
+    if state["inputs"] != versions(task.inputs):
+        return "inputs changed"
+    if state["outputs"] != versions(task.outputs):
+        return "outputs changed"
+
+    return None
+
+
+#---------------------------------------------------------------#
+# Run
+#---------------------------------------------------------------#
+def run(tasks, max_workers=None, force=False):
+    """
+    Run tasks, in parallel where their deps allow.
+
+    tasks: list of Task
+    max_workers: int. Defaults to one process per task;
+            the jobs mostly wait on downloads and S3, not CPU.
+    force: bool. If True, run every task, changed or not.
+
+    Returns dict of {task name: result}, each with a status
+    (ran, unchanged, failed, blocked), duration in seconds, and reason.
+    Raises RuntimeError at the end if any task failed,
+    after everything that didn't depend on it has run.
+    """
+    by_name = {task.name: task for task in tasks}
+    for task in tasks:
+        missing = [dep for dep in task.deps if dep not in by_name]
+        if missing:
+            raise ValueError(f"{task.name} depends on unknown tasks {missing}")
+
+    pending = dict(by_name)
+    running = {}
+    results = {}
+
+    with ProcessPoolExecutor(max_workers=max_workers or max(len(tasks), 1)) as pool:
+        while pending or running:
+            # Keep going until nothing else is ready; a skipped task can unblock others
+            ready = [task for task in pending.values()
+                     if all(dep in results for dep in task.deps)]
+
+            for task in ready:
+                del pending[task.name]
+
+                failed = [dep for dep in task.deps
+                          if results[dep]["status"] in ["failed", "blocked"]]
+                if failed:
+                    results[task.name] = _result("blocked", reason=f"{failed} failed")
+                    continue
+
+                reason = "forced" if force else needs_run(task, results)
+                if reason is None:
+                    results[task.name] = _result("unchanged")
+                    continue
+
+                future = pool.submit(run_task, task.func)
+                running[future] = (task, reason)
+
+            if ready:
+                continue
+
+            if not running:
+                raise ValueError(f"Circular deps between tasks {sorted(pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                task, reason = running.pop(future)
+                try:
+                    output = future.result()
+                except KeyboardInterrupt:
+                    raise
+                except BaseException:
+                    # Anything a task raises fails that task, not the whole run
+                    traceback.print_exc()
+                    results[task.name] = _result("failed", reason=reason)
+                    continue
+
+                write_state(task, output["duration"])
+                results[task.name] = _result("ran", output["duration"], reason,
+                                             output["artifacts"])
+
+    print_results(results)
+
+    failed = [name for name, result in results.items() if result["status"] == "failed"]
+    if failed:
+        raise RuntimeError(f"Tasks failed: {failed}")
+
+    return results
+
+
+def _result(status, duration=0.0, reason=None, written=None):
+    return {
+        "status": status,
+        "duration": duration,
+        "reason": reason,
+        "artifacts": written or {"written": [], "skipped": []},
+    }
+
+
+def print_results(results):
+    for name, result in results.items():
+        line = f"{name}: {result['status']} ({result['duration']:.1f}s)"
+        if result["reason"] is not None:
+            line += f", {result['reason']}"
+
+        written = result["artifacts"]
+        if written["written"] or written["skipped"]:
+            line += (f", {len(written['written'])} outputs written, "
+                     f"{len(written['skipped'])} unchanged")
+
+        print(line)
@@ -0,0 +1,149 @@
+"""
+Read-optimized layout for us-county-time-series.
+
+The monolithic `us-county-time-series.parquet` is still written
+(upload-data checks it into GitHub, jhu_county appends to it),
+but readers use a copy partitioned by state (state=California/...),
+sorted by fips and date within each state, with small row groups
+and column statistics.
+
+Filters on state, fips, county and date are pushed down to pyarrow:
+a state filter only opens that state's partition, and
+fips / date filters skip row groups using their min/max statistics.
+"""
+import fsspec
+import pandas as pd
+import urllib.parse
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from processing_utils import dataset_cache
+from processing_utils import default_parameters
+from processing_utils import useful_dict
+
+S3_FILE_PATH = default_parameters.S3_FILE_PATH
+time_zone = default_parameters.time_zone
+
+DATASET_URL = f"{S3_FILE_PATH}us-county-time-series"
+
+PARTITION_COL = "state"
+SORT_COLS = ["fips", "date"]
+
+# A county is ~1 row per day, so a row group holds a handful of counties
+ROW_GROUP_ROWS = 4_096
+
+# Read state back as a plain string, not a pandas categorical
+PARTITIONING = ds.partitioning(pa.schema([(PARTITION_COL, pa.string())]), flavor="hive")
+
+state_names = {abbrev: name for name, abbrev in useful_dict.us_state_abbrev.items()}
+
+
+#---------------------------------------------------------------#
+# Write
+#---------------------------------------------------------------#
+def write_us_county_dataset(df, url=DATASET_URL):
+    """
+    Write df partitioned by state, sorted by fips and date.
+    Partitions being written replace what's there, and partitions for
+    states that aren't in df anymore are removed.
+    use_threads=False keeps rows in sorted order within each file.
+    """
+    df = (df.assign(**{PARTITION_COL: df[PARTITION_COL].astype(str)})
+          .sort_values([PARTITION_COL] + SORT_COLS)
+          .reset_index(drop=True)
+         )
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    fs, path = fsspec.core.url_to_fs(url)
+
+    file_options = ds.ParquetFileFormat().make_write_options(
+        compression="snappy", write_statistics=True)
+
+    ds.write_dataset(
+        table, path,
+        filesystem=fs,
+        format="parquet",
+        partitioning=PARTITIONING,
+        file_options=file_options,
+        basename_template="part-{i}.parquet",
+        max_rows_per_group=ROW_GROUP_ROWS,
+        existing_data_behavior="delete_matching",
+        use_threads=False,
+    )
+
+    remove_stale_partitions(fs, path, set(df[PARTITION_COL]))
+
+
+def remove_stale_partitions(fs, path, states):
+    """
+    delete_matching only replaces the partitions that were written again.
+    A state that dropped out of the source (renamed, mis-parsed) would
+    otherwise stay in the dataset, and in every read.
+    """
+    for partition in fs.ls(path, detail=False):
+        name = partition.rstrip("/").rsplit("/", 1)[-1]
+        if not name.startswith(f"{PARTITION_COL}="):
+            continue
+
+        # Partition values are URI-encoded (state=New%20York)
+        state = urllib.parse.unquote(name.split("=", 1)[1])
+        if state not in states:
+            fs.rm(partition, recursive=True)
+
+
+#---------------------------------------------------------------#
+# Read
+#---------------------------------------------------------------#
+def to_calendar_date(date):
+    """
+    Our date column is a calendar date (date32).
+    Timestamps with a time zone are converted to Pacific first.
+    """
+    date = pd.Timestamp(date)
+    if date.tzinfo is not None:
+        date = date.tz_convert(time_zone)
+
+    return date.date()
+
+
+def dataset_filters(states=None, fips=None, counties=None,
+                    start_date=None, end_date=None):
+    """
+    pyarrow filters (list of tuples) for read_us_county, or None.
+    states can be full names or abbreviations. Dates are inclusive.
+    """
+    filters = []
+
+    if states is not None:
+        filters.append((PARTITION_COL, "in", sorted({state_names.get(s, s) for s in states})))
+    if fips is not None:
+        filters.append(("fips", "in", sorted(set(fips))))
+    if counties is not None:
+        filters.append(("county", "in", sorted(set(counties))))
+    if start_date is not None:
+        filters.append(("date", ">=", to_calendar_date(start_date)))
+    if end_date is not None:
+        filters.append(("date", "<=", to_calendar_date(end_date)))
+
+    return filters or None
+
+
+def read_us_county(states=None, fips=None, counties=None,
+                   start_date=None, end_date=None,
+                   columns=None, normalize=None, url=DATASET_URL):
+    """
+    Read the partitioned dataset (through the dataset cache),
+    with filters pushed down to pyarrow.
+
+    columns: list, subset of columns to read.
+    normalize: function, applied once to the frame after it's read.
+    """
+    kwargs = {"partitioning": PARTITIONING}
+
+    filters = dataset_filters(states, fips, counties, start_date, end_date)
+    if filters is not None:
+        kwargs["filters"] = filters
+    if columns is not None:
+        kwargs["columns"] = columns
+
+    return dataset_cache.read_parquet(url, normalize=normalize, **kwargs)
@@ -13,6 +13,10 @@ import numpy as np
 import pandas as pd
 
 from processing_utils import default_parameters
+from processing_utils import feature_store
+from processing_utils import population_crosswalk
+from processing_utils import schemas
+from processing_utils import us_county_dataset
 from processing_utils import utils
 
 from IPython.display import Markdown, HTML
@@ -26,9 +30,23 @@ fulldate_format = default_parameters.fulldate_format
 
 
 # Clean the JHU county data at once
-def clean_jhu(start_date):
-    df = utils.prep_us_county_time_series()
+# states: list of state names / abbreviations.
+# Subset from the feature store's national table if it's fresh,
+# otherwise only those partitions are read.
+def clean_jhu(start_date, states=None):
+    df = feature_store.read("clean_jhu", start_date=start_date)
+    
+    if df is None:
+        return build_clean_jhu(start_date, states=states)
+    
+    if states is not None:
+        states = [us_county_dataset.state_names.get(s, s) for s in states]
+        df = df[df.state.isin(states)]
+    
+    return df
 
+
+def build_clean_jhu(start_date, states=None):
     keep_cols = [
         "county",
         "state",
@@ -42,22 +60,20 @@ def clean_jhu(start_date):
         "new_cases",
         "new_deaths",
     ]
+    
+    df = utils.prep_us_county_time_series(keep_cols, states=states)
 
     df = (df[keep_cols]
         .sort_values(["county", "state", "fips", "date"])
         .reset_index(drop=True)
     )
     
-    # Merge in population
-    pop = (pd.read_csv(utils.CROSSWALK_URL, 
-                       dtype={"county_fips": "str", "cbsacode": "str"})
-           [["county_fips", "county_pop"]]
-           .rename(columns = {"county_fips": "fips"})
-          )
-
-    df = pd.merge(df, pop,
-                  on = "fips", how = "inner", validate = "m:1"
-    )
+    # Merge in population (only keep counties found in the crosswalk)
+    pop = population_crosswalk.county_pop()
+    df = df[df.fips.isin(pop.index)]
+    df = df.assign(
+        county_pop = df.fips.astype(str).map(pop)
+    ).reset_index(drop=True)
     
     df = utils.find_outliers(df, threshold=3)
     df = utils.calculate_rolling_average(df, start_date, today_date)
@@ -69,8 +85,20 @@ def clean_jhu(start_date):
 
 # Clean all CA counties hospitalizations data at once
 def clean_hospitalizations(start_date):
+    df = feature_store.read("clean_hospitalizations", start_date=start_date)
+    
+    if df is None:
+        df = build_clean_hospitalizations(start_date)
+    
+    return df
+
+
+def build_clean_hospitalizations(start_date):
+    read_cols = ["county", "county_fips", "date", 
+                 "hospitalized_covid", "all_hospital_beds", 
+                 "icu_covid", "all_icu_beds"]
     
-    df = pd.read_parquet(utils.HOSPITAL_SURGE_URL)
+    df = schemas.load("ca-hospital-and-surge-capacity", columns=read_cols)
     
     df = (df.assign(
             date = pd.to_datetime(df.date).dt.date,
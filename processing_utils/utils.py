@@ -3,12 +3,23 @@ Functions to create county or state-specific indicators.
 Use JHU county data.
 Specific City of LA data also used to generate LA-specific charts. 
 """
+import io
 import numpy as np
 import pandas as pd
 import pytz
 
+from processing_utils import array_utils
+from processing_utils import dataset_cache
 from processing_utils import default_parameters
+from processing_utils import feature_store
+from processing_utils import fetch
+from processing_utils import growth_metrics
 from processing_utils import make_charts
+from processing_utils import outliers
+from processing_utils import parquet_dtypes
+from processing_utils import population_crosswalk
+from processing_utils import schemas
+from processing_utils import us_county_dataset
 from processing_utils import useful_dict
 
 from datetime import date, datetime, timedelta
@@ -26,10 +37,7 @@ TESTING_URL = f"{S3_FILE_PATH}county-city-testing.parquet"
 
 HOSPITAL_SURGE_URL = f"{S3_FILE_PATH}ca-hospital-and-surge-capacity.parquet"
 
-CROSSWALK_URL = (
-    "https://raw.githubusercontent.com/CityOfLosAngeles/covid19-indicators/master/data/"
-    "msa_county_pop_crosswalk.csv"
-)
+CROSSWALK_URL = population_crosswalk.CROSSWALK_URL
 
 COUNTY_VACCINE_URL = (
     "https://data.chhs.ca.gov/dataset/e283ee5a-cf18-4f20-a92c-ee94a2866ccd/resource/"
@@ -89,21 +97,53 @@ def msa_case_charts(msa_name, start_date):
 Sub-functions for case, deaths data.
 """
 # (1) Sub-function to prep all US time-series data
-def prep_us_county_time_series():
-    df = pd.read_parquet(US_COUNTY_URL)
+# Read through the dataset cache, so the parquet is downloaded and parsed once per process
+def prep_us_county_time_series(columns=None, **filters):
+    """
+    columns: list, columns the caller needs. Defaults to all of them.
+            state_abbrev is derived from state, so ask for state to get it.
+    filters: states, fips, counties, start_date, end_date.
+            Pushed down to the partitioned dataset, so only what's needed gets read.
+    """
+    if columns is not None:
+        columns = [c for c in columns if c != "state_abbrev"]
+    
+    df = schemas.load("us-county-time-series", 
+                      columns=columns,
+                      filters=us_county_dataset.dataset_filters(**filters),
+                      normalize=normalize_us_county_time_series)
+    
+    return df
+
+
+def normalize_us_county_time_series(df):
     df = df.assign(
         date=pd.to_datetime(df.date).dt.date,
-        state_abbrev=df.state.map(useful_dict.us_state_abbrev),
     )
     
+    # county and fips come back as categoricals
+    df = parquet_dtypes.sort_categories(df)
+    
+    if "state" in df.columns:
+        df = df.assign(
+            state_abbrev=df.state.map(useful_dict.us_state_abbrev),
+        )
+    
     return df
 
 
 # (2a) Sub-function to prep county data
 def prep_county(county_state_name, start_date):
-    df = prep_us_county_time_series()
+    df = prep_counties([county_state_name], start_date)
+    
+    return df
 
-    # Parse the county_state_name into county_name and state_name (abbrev)
+
+def parse_county_state_name(county_state_name, df):
+    """
+    Parse the county_state_name into county_name and state_name (abbrev).
+    Accepts "Los Angeles, CA", "Los Angeles County, California" or a fips code.
+    """
     if "," in county_state_name:
         state_name = county_state_name.split(",")[1].strip()
         county_name = county_state_name.split(",")[0].strip()
@@ -119,6 +159,18 @@ def prep_county(county_state_name, start_date):
         state_name = df[df.fips == county_state_name].state_abbrev.iloc[0]
         county_name = df[df.fips == county_state_name].county.iloc[0]
 
+    return county_name, state_name
+
+
+# (2a) Batch version: prep many counties with 1 load and 1 grouped computation
+def prep_counties(county_state_names, start_date, as_dict=False):
+    """
+    county_state_names: list of str, in any format prep_county takes.
+    as_dict: bool. If True, return dict of {county_state_name: df}, 
+            otherwise return one long df sorted by county, state, fips, date.
+    """
+    # Names with a state in them only need those states' partitions.
+    # A fips code needs the full table to look up its county and state.
     keep_cols = [
         "county",
         "state",
@@ -132,37 +184,57 @@ def prep_county(county_state_name, start_date):
         "new_cases",
         "new_deaths",
     ]
+    
+    has_state = all("," in name for name in county_state_names)
+    df = None if has_state else prep_us_county_time_series(keep_cols)
+    
+    parsed = {name: parse_county_state_name(name, df) 
+              for name in county_state_names}
+    counties = {county for county, state in parsed.values()}
+    states = {state for county, state in parsed.values()}
+    
+    if has_state:
+        df = prep_us_county_time_series(keep_cols, states=states)
 
+    # Narrow down with cheap isin filters first, then match exact county-state pairs
+    df = df[(df.state_abbrev.isin(states)) & (df.county.isin(counties))]
+    
+    pairs = pd.Series(list(zip(df.county, df.state_abbrev)), index=df.index, dtype="object")
     df = (
-        df[
-            (df.county == county_name)
-            & (df.state_abbrev == state_name)
-        ][keep_cols]
+        df[pairs.isin(set(parsed.values()))][keep_cols]
         .sort_values(["county", "state", "fips", "date"])
         .reset_index(drop=True)
     )
     
-    # Merge in population
-    pop = (pd.read_csv(CROSSWALK_URL, dtype={"county_fips": "str", "cbsacode": "str"})
-           [["county_fips", "county_pop"]]
-           .rename(columns = {"county_fips": "fips"})
-          )
-
-    df = pd.merge(df, pop,
-                  on = "fips", how = "inner", validate = "m:1"
-    )
+    # Merge in population (only keep counties found in the crosswalk)
+    pop = population_crosswalk.county_pop()
+    df = df[df.fips.isin(pop.index)]
+    df = df.assign(
+        county_pop = df.fips.astype(str).map(pop)
+    ).reset_index(drop=True)
     
+    group_cols = ["county", "state", "fips"]
     df = find_outliers(df, threshold=3)
-    df = calculate_rolling_average(df, start_date, today_date)
+    df = calculate_rolling_average(df, start_date, today_date, group_cols)
     df = find_tier_cutoffs(df, "county_pop")
     
+    if as_dict:
+        return {name: (df[(df.county == county) & (df.state_abbrev == state)]
+                       .reset_index(drop=True))
+                for name, (county, state) in parsed.items()}
+    
     return df
 
 
 # (2b) Sub-function to prep state data
 def prep_state(state_name, start_date):
-    df = prep_us_county_time_series()
+    df = prep_states([state_name], start_date)
+
+    return df
+
 
+# (2b) Batch version: state_names can be full names or abbreviations
+def prep_states(state_names, start_date, as_dict=False):
     keep_cols = [
         "state",
         "state_abbrev",
@@ -172,10 +244,12 @@ def prep_state(state_name, start_date):
         "new_state_cases",
         "new_state_deaths",
     ]
+    
+    df = prep_us_county_time_series(keep_cols, states=state_names)
 
     df = (
-        df[(df.state == state_name) | 
-           (df.state_abbrev == state_name)
+        df[(df.state.isin(state_names)) | 
+           (df.state_abbrev.isin(state_names))
         ][keep_cols]
         .sort_values(["state", "date"])
         .drop_duplicates()
@@ -190,49 +264,49 @@ def prep_state(state_name, start_date):
         .reset_index(drop=True)
     )
     
-    # Merge in population
-    pop = (pd.read_csv(CROSSWALK_URL, dtype={"county_fips": "str", "cbsacode": "str"})
-           [["state", "county_pop"]]
-          )
-    
-    pop = (pop.groupby("state")
-           .agg({"county_pop":"sum"})
-           .reset_index()
-           .rename(columns = {"county_pop": "state_pop"})
-          )
-
-    df = pd.merge(df, pop,
-                  on = "state", how = "inner", validate = "m:1"
-    )
+    # Merge in population (only keep states found in the crosswalk)
+    pop = population_crosswalk.state_pop()
+    df = df[df.state.isin(pop.index)]
+    df = df.assign(
+        state_pop = df.state.map(pop)
+    ).reset_index(drop=True)
     
+    group_cols = ["state"]
     df = find_outliers(df, threshold=3)
-    df = calculate_rolling_average(df, start_date, today_date)
+    df = calculate_rolling_average(df, start_date, today_date, group_cols)
     df = find_tier_cutoffs(df, "state_pop")
 
+    if as_dict:
+        return {name: (df[(df.state == name) | (df.state_abbrev == name)]
+                       .reset_index(drop=True))
+                for name in state_names}
+
     return df
 
 
 # (2c) Sub-function to prep MSA data
 def prep_msa(msa_name, start_date):
+    df = prep_msas([msa_name], start_date)
+
+    return df
+
+
+# (2c) Batch version
+def prep_msas(msa_names, start_date, as_dict=False):
     group_cols = ["msa", "msa_pop", "date"]
     msa_group_cols = ["msa", "msa_pop"]
 
     # Merge county to MSA using crosswalk
-    df = prep_us_county_time_series()
-
-    pop = pd.read_csv(CROSSWALK_URL, dtype={"county_fips": "str", "cbsacode": "str"},)
-    pop = (pop[
-            (pop.cbsatitle == msa_name)
-            | (pop.cbsatitle.str.contains(msa_name))
-            | (pop.cbsacode == msa_name)
-            ][["cbsacode", "cbsatitle", "msa_pop", "county_fips"]]
-           .assign(
-               msa=pop.cbsatitle
-           )
-    )
+    pop = (pd.concat([population_crosswalk.msa_members(name) for name in msa_names])
+           .drop_duplicates(subset=["cbsacode", "county_fips"])
+          )
+    
+    df = prep_us_county_time_series(["fips", "date", "cases", "deaths"], 
+                                    fips=pop.county_fips)
 
     final_df = pd.merge(
-        df, pop, left_on="fips", right_on="county_fips", how="inner", validate="m:1",
+        df[df.fips.isin(pop.county_fips)], pop, 
+        left_on="fips", right_on="county_fips", how="inner", validate="m:1",
     )
 
     df = (
@@ -252,21 +326,38 @@ def prep_msa(msa_name, start_date):
     )
     
     df = find_outliers(df, threshold=3)
-    df = calculate_rolling_average(df, start_date, today_date)
+    df = calculate_rolling_average(df, start_date, today_date, ["msa"])
     df = find_tier_cutoffs(df, "msa_pop")
 
+    if as_dict:
+        titles = {name: population_crosswalk.msa_members(name).msa.unique() 
+                  for name in msa_names}
+        return {name: df[df.msa.isin(titles[name])].reset_index(drop=True)
+                for name in msa_names}
+
     return df
 
 
-def calculate_rolling_average(df, start_date, today_date):
+def calculate_rolling_average(df, start_date, today_date, group_cols=None):
     # Drop any NaNs or rolling average will choke
     df = df.dropna(subset = ["new_cases", "new_deaths"])
     
     # Derive new columns
-    df = df.assign(
-        cases_avg7=df.new_cases.rolling(window=7).mean(),
-        deaths_avg7=df.new_deaths.rolling(window=7).mean(),
-    )    
+    # With group_cols, each geography gets its own rolling window (df sorted by date within group)
+    if group_cols is None:
+        df = df.assign(
+            cases_avg7=df.new_cases.rolling(window=7).mean(),
+            deaths_avg7=df.new_deaths.rolling(window=7).mean(),
+        )    
+    else:
+        rolling = (df.groupby(group_cols, sort=False, observed=True)[["new_cases", "new_deaths"]]
+                   .rolling(window=7).mean()
+                   .reset_index(level=list(range(len(group_cols))), drop=True)
+                  )
+        df = df.assign(
+            cases_avg7=rolling.new_cases,
+            deaths_avg7=rolling.new_deaths,
+        )
     
     # Subset from start date up to yesterday's date
     # Have version of date that we can use in chart
@@ -300,39 +391,10 @@ def find_outliers(df, threshold=5):
     # Found 1 case of outlier in LA on 5/27/21, where it showed over 4,000 new cases in the raw data
     # But surrounding days are in the 100-200's.
     # Use a generalized function to suppress outlier dates
-    sort_cols = ["county", "state", "fips", "date"]
-    group_cols = ["county", "state", "fips"]
-    
-    df = df.assign(
-        previous_day = (df.sort_values(sort_cols)
-                        .groupby(group_cols)["new_cases"]
-                        .apply(lambda x: x.shift(1))
-                       ),
-        post_day = (df.sort_values(sort_cols)
-                    .groupby(group_cols)["new_cases"]
-                    .apply(lambda x: x.shift(-1))
-                   ),
-    )
-    
-    # When we get to small numbers of new cases, it's easy for it to oscillate more
-    # Let's only apply outlier rule if previous/post day new cases > 100. 
+    # Vectorized in outliers module; works on 1 county or all US counties in one pass.
+    # Let's only apply outlier rule if previous/post day new cases > 100 (SMALL_NUMBERS_CUTOFF). 
     # Definitely when it's single digits, cases can easily jump from 10 new cases to 100 new cases
-    SMALL_NUMBERS_CUTOFF = 100
-    df = df.assign(
-        outlier = (df.dropna()
-                   .apply(lambda x: 1 if (x.new_cases >= (x.previous_day*threshold)) and 
-                          (x.new_cases >= (x.post_day*threshold)) and 
-                          (x.previous_day > SMALL_NUMBERS_CUTOFF) and (x.post_day > SMALL_NUMBERS_CUTOFF)
-                           else 0, axis=1)
-                  )
-    )
-    
-    # Drop the outlier
-    df = (df[df.outlier==0]
-          .drop(columns=["previous_day", "post_day", "outlier"])
-          .sort_values(sort_cols)
-          .reset_index(drop=True)
-         )
+    df = outliers.remove_outliers(df, rules=[outliers.ratio_rule(threshold)])
     
     return df
 
@@ -351,7 +413,7 @@ def lacity_case_charts(start_date):
 Sub-functions for City of LA case data.
 """
 def prep_lacity_cases(start_date):
-    df = pd.read_parquet(LA_CITY_URL)
+    df = dataset_cache.read_parquet(LA_CITY_URL)
 
     df = (df.assign(
             date = pd.to_datetime(df.date).dt.date,
@@ -404,18 +466,19 @@ def lacity_testing_charts(start_date, lower_bound, upper_bound):
 Sub-functions for testing data.
 """
 def prep_testing(start_date):
-    df = pd.read_parquet(TESTING_URL)
+    # 7/20: since we can't figure out how mayor's spreadsheet ties with Rshiny
+    # Just use county data, drop city for now
+    keep_col = ["date", "date2", "County_Person_Performed", "County_Person_Positive",
+               "County_Performed", "County_Positive"]
+    
+    df = schemas.load("county-city-testing", 
+                      columns=[c for c in keep_col if c != "date2"])
 
     df = df.assign(
         date=df.date.astype(str).apply(lambda x: datetime.strptime(x, "%Y-%m-%d").date()),
         date2 = pd.to_datetime(df.date),
     )
     
-    # 7/20: since we can't figure out how mayor's spreadsheet ties with Rshiny
-    # Just use county data, drop city for now
-    keep_col = ["date", "date2", "County_Person_Performed", "County_Person_Positive",
-               "County_Performed", "County_Positive"]
-    
     # Subset by start date up to yesterday's date    
     df = (df[(df.date >= start_date) & (df.date < today_date)]
             [keep_col]
@@ -644,15 +707,23 @@ def county_covid_hospital_charts(county_state_name, start_date):
 """
 Sub-functions for county hospitalizations data.
 """
-def prep_hospital_surge(county_state_name, start_date):
-    df = pd.read_parquet(HOSPITAL_SURGE_URL)
-    
-    df = (df.assign(
-            date = pd.to_datetime(df.date).dt.date,
-            date2 = pd.to_datetime(df.date),
-        ).rename(columns = {"county_fips": "fips"})
-    )
-    
+hospital_read_cols = ["county", "county_fips", "date", 
+                      "hospitalized_covid", "all_hospital_beds", 
+                      "icu_covid", "all_icu_beds", "surge_available_beds"]
+
+hospital_keep_cols = [
+    "county",
+    "fips",
+    "date",
+    "date2",
+    "hospitalized_covid",
+    "all_hospital_beds",
+    "icu_covid",
+    "all_icu_beds",
+    "surge_available_beds"
+]
+
+def hospital_county_name(county_state_name):
     # Parse the county_state_name into county_name and state_name (abbrev)
     if "," in county_state_name:
         county_state_name = county_state_name.split(",")[0].strip()
@@ -660,25 +731,38 @@ def prep_hospital_surge(county_state_name, start_date):
     # County names don't have " County" at the end. There is a TriCounty, UT though.
     if " County" in county_state_name:
         county_state_name = county_state_name.replace(" County", "").strip()
+    
+    return county_state_name
 
-    elif any(map(str.isdigit, county_state_name)):
-        county_state_name = df[df.fips == county_state_name].county.iloc[0]
 
+def load_hospital_surge(county_names):
+    # Only read the counties we want, unless we need to look one up by fips first
+    is_fips = any(any(map(str.isdigit, name)) for name in county_names)
+    filters = None if is_fips else [("county", "in", sorted(set(county_names)))]
     
-    keep_cols = [
-        "county",
-        "fips",
-        "date",
-        "date2",
-        "hospitalized_covid",
-        "all_hospital_beds",
-        "icu_covid",
-        "all_icu_beds",
-        "surge_available_beds"
-    ]
+    df = schemas.load("ca-hospital-and-surge-capacity", 
+                      columns=hospital_read_cols, filters=filters)
+    
+    df = (df.assign(
+            date = pd.to_datetime(df.date).dt.date,
+            date2 = pd.to_datetime(df.date),
+        ).rename(columns = {"county_fips": "fips"})
+    )
+    
+    return df
+
+
+def prep_hospital_surge(county_state_name, start_date):
+    county_state_name = hospital_county_name(county_state_name)
+    is_fips = any(map(str.isdigit, county_state_name))
+    
+    df = load_hospital_surge([county_state_name])
+    
+    if is_fips:
+        county_state_name = df[df.fips == county_state_name].county.iloc[0]
 
     df = (
-        df[df.county == county_state_name][keep_cols]
+        df[df.county == county_state_name][hospital_keep_cols]
         .sort_values(["county", "fips", "date"])
         .reset_index(drop=True)
     )
@@ -695,6 +779,48 @@ def prep_hospital_surge(county_state_name, start_date):
     return df
 
 
+def prep_hospital_surges(county_state_names, start_date, as_dict=False):
+    """
+    prep_hospital_surge for many counties, reading the data once.
+    
+    county_state_names: list of str, in any format prep_hospital_surge takes.
+    as_dict: bool. If True, return dict of {county_state_name: df}, 
+            otherwise return one long df sorted by county, fips, date.
+    """
+    names = {name: hospital_county_name(name) for name in county_state_names}
+    
+    df = load_hospital_surge(list(names.values()))
+    
+    # Fips codes -> county names
+    names = {name: (df[df.fips == county].county.iloc[0] 
+                    if any(map(str.isdigit, county)) else county)
+             for name, county in names.items()}
+    
+    df = (
+        df[df.county.isin(set(names.values()))][hospital_keep_cols]
+        .sort_values(["county", "fips", "date"])
+        .reset_index(drop=True)
+    )
+    
+    # Calculate 7-day average, within each county
+    def avg7(col):
+        return df.groupby("county", observed=True)[col].transform(
+            lambda x: x.rolling(window=7).mean())
+    
+    df = df.assign(
+        hospitalized_avg7 = avg7("hospitalized_covid"),
+        icu_avg7 = avg7("icu_covid"),
+    )
+
+    df = df[(df.date >= start_date) & (df.date < today_date)]
+    
+    if as_dict:
+        return {name: df[df.county == county].reset_index(drop=True)
+                for name, county in names.items()}
+
+    return df.reset_index(drop=True)
+
+
 # Make the df long so that we can get the encoding to show up in altair chart
 def make_long(df):
     keep = ["county", "fips", "date", "date2",
@@ -721,52 +847,32 @@ def days_since_100_cases(df, sort_cols, group_cols):
     
     # Start counting day 1 as when 100 cases is reached
     df = df.assign(
-        gt_100cases = df.apply(lambda x: 1 if x.cases >= 100 else 0, axis=1)
+        gt_100cases = growth_metrics.above_threshold(df, "cases", 100)
     )
 
+    # Count days within each group, in sort order
+    sort_cols = group_cols + [c for c in sort_cols if c not in group_cols]
+    order, group_ids = array_utils.sort_and_group(df, sort_cols, group_cols)
+    
     df = df.assign(
-        days_obs = df.sort_values(sort_cols).groupby(group_cols).cumcount() + 1
+        days_obs = array_utils.unsort(array_utils.grouped_cumcount(group_ids) + 1, order)
     )
 
     
     return df
 
 def doubling_time(df, window=7):
-    sort_cols = ["fips", "county", "date"]
-    group_cols = ["fips", "county", "gt_100cases"]
-    
-    df = days_since_100_cases(df, sort_cols, group_cols)
-    
-    shift_amt = (window - 1)
-    df = df.assign(
-        cases_in_past = (df.sort_values(sort_cols)
-                           .groupby(group_cols)["cases"]
-                           .apply(lambda x: x.shift(shift_amt))
-                          ),
-        days_in_past = (df.sort_values(sort_cols)
-                          .groupby(group_cols)["days_obs"]
-                          .apply(lambda x: x.shift(shift_amt))
-                         ),
-    )
-    
-    np.seterr(divide='ignore')
-    #https://stackoverflow.com/questions/27784528/numpy-division-with-runtimewarning-invalid-value-encountered-in-double-scalars?rq=1
-    df = df.assign(
-        doubling_time = ( ((df.days_obs - df.days_in_past) * np.log(2)) / 
-                        ( np.log(df.cases / df.cases_in_past) )
-                       ),
+    # Vectorized in growth_metrics; counts days before / after 100 cases separately
+    # and sets doubling time to NaN if it's before 100 cases
+    metrics = growth_metrics.compute_growth_metrics(
+        df, windows=[window], threshold=100, 
+        value_col="cases", group_cols=["fips", "county"], sort_col="date"
     )
     
-    # Set doubling time to NaN if it's before 100 cases
     df = df.assign(
-        doubling_time = df.apply(lambda x: x.doubling_time if x.gt_100cases==1 
-                                 else np.nan, axis=1)
+        doubling_time = metrics[f"doubling_time_{window}"]
     )
     
-    drop_cols = ["gt_100cases", "days_in_past", "cases_in_past", "days_obs"]
-    
-    df = df.drop(columns = drop_cols)
-    
     return df
 
 
@@ -774,7 +880,16 @@ def doubling_time(df, window=7):
 # Vaccines Administered
 #---------------------------------------------------------------#
 def clean_vaccines_by_county():
-    df = pd.read_csv(COUNTY_VACCINE_URL)
+    df = feature_store.read("clean_vaccines_by_county")
+    
+    if df is None:
+        df = build_clean_vaccines_by_county()
+    
+    return df
+
+
+def build_clean_vaccines_by_county():
+    df = pd.read_csv(io.BytesIO(fetch.fetch(COUNTY_VACCINE_URL).content))
     
     population = pd.read_parquet(f"{S3_FILE_PATH_SOURCE}ca_county_pop_crosswalk.parquet")    
     
@@ -806,7 +921,7 @@ def clean_vaccines_by_county():
 
 
 def clean_vaccines_by_demographics():
-    df = pd.read_csv(COUNTY_DEMOGRAPHICS_URL)
+    df = pd.read_csv(io.BytesIO(fetch.fetch(COUNTY_DEMOGRAPHICS_URL).content))
     
     df = df.assign(
             date = pd.to_datetime(df.administered_date),
@@ -0,0 +1,290 @@
+"""
+Streaming wide-to-long converter for the JHU time-series CSVs.
+
+The JHU CSVs have one row per geography and one column per date.
+Instead of reading each one with pd.read_csv, melting it
+(which repeats every id column for every date), and merging
+cases with deaths on UID/date, read them with Arrow's chunked CSV reader,
+in lockstep, and emit the long table a batch of rows at a time.
+The CSVs list geographies in the same order, so the values line up
+by position; the key columns are checked on every batch.
+"""
+import csv
+import io
+import urllib.request
+
+from datetime import datetime
+
+import fsspec
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+# JHU date columns look like 1/22/20
+DATE_FORMAT = "%m/%d/%y"
+
+# Geographies (rows) per emitted batch. Each becomes ~1,000 long rows per date column.
+BATCH_ROWS = 512
+
+# Bytes Arrow reads per block
+BLOCK_SIZE = 1 << 20
+
+
+def is_date_column(name):
+    try:
+        datetime.strptime(name, DATE_FORMAT)
+        return True
+    except ValueError:
+        return False
+
+
+def parse_columns(columns):
+    """
+    Split column names into id columns and date columns.
+    Any column that parses as a date is a date, whatever the year.
+    """
+    id_vars, dates = [], []
+
+    for c in columns:
+        if is_date_column(c):
+            dates.append(c)
+        else:
+            id_vars.append(c)
+
+    return id_vars, dates
+
+
+def column_dates(dates):
+    """
+    Date column names to (naive) timestamps
+    """
+    return pd.to_datetime(pd.Index(dates), format=DATE_FORMAT)
+
+
+#---------------------------------------------------------------#
+# Read
+#---------------------------------------------------------------#
+def open_source(source):
+    """
+    source: URL, path, the CSV's bytes, or a binary file object
+            (already downloaded, see fetch.Source.open).
+    """
+    if isinstance(source, bytes):
+        return io.BytesIO(source)
+
+    if hasattr(source, "read"):
+        return source
+
+    if source.startswith(("http://", "https://")):
+        return urllib.request.urlopen(source)
+
+    return fsspec.open(source, "rb").open()
+
+
+def open_wide_csv(source, id_types=None, keep_dates=None, value_type=pa.float64(),
+                  block_size=BLOCK_SIZE):
+    """
+    Open a wide CSV as a stream of Arrow record batches.
+
+    id_types: dict of {column: pyarrow type} for id columns that aren't strings.
+    keep_dates: function that takes the list of date columns and returns
+                the ones to read. Defaults to all of them.
+                Other date columns aren't converted at all.
+    value_type: pyarrow type of the date columns. Missing values stay null
+                (see to_matrix).
+
+    Returns the reader, the id columns, and the date columns it reads.
+    """
+    stream = open_source(source)
+
+    # Read the header ourselves, so we know the column types before Arrow does
+    header = stream.readline().decode("utf-8-sig")
+    columns = next(csv.reader([header]))
+
+    id_vars, dates = parse_columns(columns)
+    if keep_dates is not None:
+        dates = keep_dates(dates)
+
+    id_types = id_types or {}
+    column_types = {c: id_types.get(c, pa.string()) for c in id_vars}
+    column_types.update({c: value_type for c in dates})
+
+    reader = pa_csv.open_csv(
+        stream,
+        read_options=pa_csv.ReadOptions(column_names=columns, block_size=block_size),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=column_types,
+            include_columns=id_vars + dates,
+            strings_can_be_null=True,
+        ),
+    )
+
+    return reader, id_vars, dates
+
+
+def aligned_batches(readers, batch_rows=BATCH_ROWS):
+    """
+    Re-chunk several record batch readers so each yield has
+    the same rows (by position) from every reader, as Arrow Tables.
+    """
+    buffers = [[] for _ in readers]
+    buffered = [0 for _ in readers]
+    exhausted = [False for _ in readers]
+
+    while True:
+        for i, reader in enumerate(readers):
+            while not exhausted[i] and buffered[i] < batch_rows:
+                try:
+                    batch = reader.read_next_batch()
+                except StopIteration:
+                    exhausted[i] = True
+                    break
+                buffers[i].append(batch)
+                buffered[i] += batch.num_rows
+
+        n = min(buffered)
+        if n == 0:
+            if any(buffered):
+                raise ValueError("Wide CSVs don't have the same number of rows")
+            return
+
+        n = min(n, batch_rows)
+        tables = []
+
+        for i in range(len(readers)):
+            table = pa.Table.from_batches(buffers[i])
+            tables.append(table.slice(0, n))
+
+            rest = table.slice(n)
+            buffers[i] = rest.to_batches()
+            buffered[i] = rest.num_rows
+
+        yield tables
+
+
+#---------------------------------------------------------------#
+# Wide to long
+#---------------------------------------------------------------#
+def to_matrix(table, dates, value_type=pa.float64()):
+    """
+    n rows x len(dates) numpy array of an Arrow Table's date columns.
+
+    Integer columns come back as an int64 masked array, masked where the CSV is blank,
+    whether or not this batch has any blanks. Otherwise missing values are NaN.
+    """
+    columns = [table.column(d) for d in dates]
+
+    if pa.types.is_integer(value_type):
+        if not columns:
+            return np.ma.MaskedArray(np.empty((table.num_rows, 0), dtype="int64"))
+
+        data = np.column_stack([c.fill_null(0).to_numpy() for c in columns])
+        mask = np.column_stack([c.is_null().to_numpy(zero_copy_only=False) for c in columns])
+        return np.ma.MaskedArray(data.astype("int64"), mask)
+
+    if not columns:
+        return np.empty((table.num_rows, 0))
+
+    return np.column_stack([c.to_numpy(zero_copy_only=False) for c in columns])
+
+
+def column_sums(matrix):
+    """
+    Sum of each column, skipping missing values
+    """
+    if isinstance(matrix, np.ma.MaskedArray):
+        return np.ma.filled(matrix.sum(axis=0), 0)
+
+    return np.nansum(matrix, axis=0)
+
+
+def to_long(ids, dates, values):
+    """
+    ids: pandas.DataFrame, n rows of id columns
+    dates: list of date column names
+    values: dict of {value_name: n x len(dates) numpy array}.
+            Masked arrays (integer values) become nullable Int64 columns.
+
+    Rows come out geography by geography (all dates for the first row, then the next).
+    """
+    n_dates = len(dates)
+
+    df = ids.loc[ids.index.repeat(n_dates)].reset_index(drop=True)
+    df["date"] = np.tile(column_dates(dates).to_numpy(), len(ids))
+
+    for name, matrix in values.items():
+        if isinstance(matrix, np.ma.MaskedArray):
+            df[name] = pd.arrays.IntegerArray(
+                matrix.data.ravel(), np.ma.getmaskarray(matrix).ravel())
+        else:
+            df[name] = matrix.ravel()
+
+    return df
+
+
+def wide_to_long_batches(sources, key_cols, id_types=None, keep_dates=None,
+                         value_type=pa.float64(), batch_rows=BATCH_ROWS, totals=None):
+    """
+    Stream several wide CSVs (same rows, same order) into one long table.
+
+    sources: dict of {value_name: CSV url, path, bytes or file object}. The first source's
+            id columns are kept.
+    key_cols: list, id columns that must match row by row across sources.
+    keep_dates: function that takes the list of date columns and returns
+                the ones to emit. Defaults to all of them.
+    totals: dict. If given, filled with {value_name: pandas.Series}
+            summing every date column (kept or not) over all rows,
+            indexed by column name.
+
+    Yields pandas.DataFrames with the id columns, date, and one column per source.
+    With an integer value_type, value columns are Int64 in every batch.
+    """
+    names = list(sources)
+
+    # Totals need every date column read, otherwise only read the ones we emit
+    read_dates = keep_dates if totals is None else None
+    opened = [open_wide_csv(sources[name], id_types, read_dates, value_type)
+              for name in names]
+
+    readers = [reader for reader, _, _ in opened]
+    id_vars = opened[0][1]
+    all_dates = opened[0][2]
+    dates = all_dates if keep_dates is None else keep_dates(all_dates)
+
+    for name, (_, _, source_dates) in zip(names, opened):
+        if source_dates != all_dates:
+            raise ValueError(f"{name} doesn't have the same date columns")
+
+    if totals is not None:
+        for name in names:
+            totals[name] = pd.Series(0.0, index=all_dates)
+
+    for tables in aligned_batches(readers, batch_rows):
+        keys = tables[0].select(key_cols)
+        for name, table in zip(names[1:], tables[1:]):
+            if not table.select(key_cols).equals(keys):
+                raise ValueError(f"{name} rows are not in the same order as {names[0]}")
+
+        values = {}
+        for name, table in zip(names, tables):
+            values[name] = to_matrix(table, dates, value_type)
+
+            if totals is not None:
+                totals[name] += column_sums(to_matrix(table, all_dates, value_type))
+
+        yield to_long(tables[0].select(id_vars).to_pandas(), dates, values)
+
+
+def wide_to_long(sources, key_cols, columns=None, **kwargs):
+    """
+    Same as wide_to_long_batches, concatenated into one DataFrame.
+
+    columns: list. If given, each batch is cut down to these columns as it arrives,
+            so id columns we don't need are never held for the whole table.
+    """
+    batches = []
+    for batch in wide_to_long_batches(sources, key_cols, **kwargs):
+        batches.append(batch if columns is None else batch[columns])
+
+    return pd.concat(batches, ignore_index=True)
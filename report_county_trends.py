@@ -1,16 +1,10 @@
 """
 Create the CA cases trends report as HTML and upload to GitHub.
 """
-import base64
-import datetime
 import os
-import subprocess
 import sys
-import time
 
-import pandas as pd
-import papermill as pm 
-from processing_utils import github_utils as gh
+from processing_utils import notebook_reports
 from processing_utils import default_parameters
 
 
@@ -49,46 +43,9 @@ notebooks_to_run = {
     "coronavirus-stats.ipynb": './coronavirus-stats.ipynb',
 }
 
-for key, file_name in notebooks_to_run.items():
-    try:
-        print(f"Running notebook {key}")
-        pm.execute_notebook(
-            f'/app/notebooks/{key}',
-            file_name,
-            cwd='/app/notebooks',
-            log_output=True
-        )
+# Notebooks run side by side, each is converted and uploaded as soon as it's done
+results = notebook_reports.publish_reports(
+    notebooks_to_run, TOKEN, REPO, BRANCH, PUBLISH_PATH, DEFAULT_COMMITTER)
 
-        print(f"Ran notebook {key}")
-
-        # shell out, run NB Convert 
-        output_format = 'html'
-        subprocess.run([
-            "jupyter",
-            "nbconvert",
-            "--to",
-            output_format,
-            "--no-input",
-            "--no-prompt",
-            file_name,
-        ]) 
-
-        print("Converted to HTML")
-        # Now find the HTML file and upload
-        name = file_name.replace(".ipynb", "").replace("./", "")
-        html_file_name = f"{name}.html" 
-        print(f"name: {name}")
-        print(f"html name: {PUBLISH_PATH}{html_file_name}")
-
-        gh.upload_file(
-                TOKEN,
-                REPO,BRANCH,
-                f"{html_file_name}",
-                f"{PUBLISH_PATH}{html_file_name}",
-                f"Update {name}",
-                DEFAULT_COMMITTER)
-
-        print("Successful upload to GitHub")
-    except: 
-        print(f"Unsuccessful upload of {key}")
-        pass
+if any(result["status"] == "failed" for result in results.values()):
+    sys.exit(1)
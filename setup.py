@@ -10,4 +10,6 @@ setup(
     include_package_data=True,
     package_dir={"processing_utils": "processing_utils"},
     install_requires=["altair", "geopandas", "numpy", "pandas"],
+    # In-process SVG rendering (chart_render), pinned to a release with Vega-Lite 4.17
+    extras_require={"render": ["vl-convert-python==0.14.0"]},
 )
\ No newline at end of file